@@ -0,0 +1,243 @@
+'''
+Benchmarks for the Document hot paths: DotDict wrapping, key conversion in
+load_dict/dump_dict, field validation, JSON encoding and save/find.
+
+Documents are saved to and loaded from the in-process memory backend, so no
+server is needed and network round trips don't drown out mongorm's own
+overhead. Run from the repository root with:
+
+    python -m benchmarks.documents --output results.json
+
+and compare a later run against it with --compare results.json.
+'''
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import platform
+import re
+import sys
+import time
+import timeit
+
+from mongorm import Database, DotDict, Field, JSONEncoder
+
+
+def small():
+    return {
+        'name': 'Rahul',
+        'email': 'r@hul.ag',
+        'age': 27,
+        'score': 12.5,
+        'active': True
+    }
+
+
+def small_fields():
+    return {
+        'name': Field.required(str),
+        'email': Field.required(str),
+        'age': Field.required(int),
+        'score': Field.optional(float),
+        'active': Field.optional(bool)
+    }
+
+
+LARGE_TYPES = [int, str, float, list]
+
+
+def large():
+    values = {
+        int: lambda i: i,
+        str: lambda i: 'value %d' % i,
+        float: lambda i: i / 4.0,
+        list: lambda i: list(range(5))
+    }
+    return dict(
+        ('field_%d' % i, values[LARGE_TYPES[i % 4]](i)) for i in range(200)
+    )
+
+
+def large_fields():
+    return dict(
+        ('field_%d' % i, [Field.optional(int)] if typ is list else
+         Field.required(typ))
+        for i, typ in zip(range(200), itertools.cycle(LARGE_TYPES))
+    )
+
+
+def nested(depth=6):
+    d = {
+        'level_name': 'level %d' % depth,
+        'level': depth,
+        'tags': ['a', 'b', 'c'],
+        'items': [{'item_id': i, 'label': str(i)} for i in range(3)]
+    }
+    if depth > 1:
+        d['child_node'] = nested(depth - 1)
+    return d
+
+
+def nested_fields(depth=6):
+    spec = {
+        'level_name': Field.required(str),
+        'level': Field.required(int),
+        'tags': [Field.optional(str)],
+        'items': [{
+            'item_id': Field.required(int),
+            'label': Field.required(str)
+        }]
+    }
+    if depth > 1:
+        spec['child_node'] = nested_fields(depth - 1)
+    return spec
+
+
+SHAPES = [
+    ('small', small, small_fields),
+    ('large', large, large_fields),
+    ('nested', nested, nested_fields)
+]
+
+
+def benchmarks():
+    '''
+    Yields (name, fn) for every benchmark, fn taking no arguments.
+    '''
+    db = Database(backend='memory', db='mongorm_benchmarks')
+    db.drop()
+    base = db.Document
+    encoder = JSONEncoder()
+
+    for shape, make, make_fields in SHAPES:
+        cls = type(shape.title(), (base, ), {
+            '__fields__': make_fields(),
+            '__compact__': True
+        })
+        raw = make()
+
+        doc = cls(raw)
+        doc.save()
+        dumped = doc.dump_json()
+
+        for _ in range(99):
+            cls(raw).save()
+
+        loaded = cls.find_one(doc._id)
+        docs = list(cls.find())
+        counter = itertools.count()
+
+        def save_changes(loaded=loaded, counter=counter):
+            loaded.revision = next(counter)
+            loaded.save()
+
+        yield shape + '.dotdict', lambda raw=raw: DotDict(raw)
+        yield shape + '.init', lambda cls=cls, raw=raw: cls(raw)
+        yield shape + '.from_raw', \
+            lambda cls=cls, raw=raw: cls.from_raw(raw)
+        yield shape + '.dump_dict', doc.dump_dict
+        yield shape + '.dump_json', doc.dump_json
+        yield shape + '.json_encoder', lambda doc=doc: encoder.encode(doc)
+        yield shape + '.load_json', \
+            lambda cls=cls, s=dumped: cls().load_json(s)
+        yield shape + '.dump_json_100', lambda docs=docs: \
+            '[' + ', '.join(d.dump_json() for d in docs) + ']'
+        yield shape + '.dump_json_many_100', \
+            lambda cls=cls, docs=docs: cls.dump_json_many(docs)
+        yield shape + '.validate_fields', doc.validate_fields
+        yield shape + '.save', doc.save
+        yield shape + '.save_changes', save_changes
+        yield shape + '.find_one', \
+            lambda cls=cls, _id=doc._id: cls.find_one(_id)
+        yield shape + '.find_100', lambda cls=cls: list(cls.find())
+        yield shape + '.find_100_compact', \
+            lambda cls=cls: list(cls.find(compact=True))
+        yield shape + '.find_columns_100', \
+            lambda cls=cls, keys=sorted(raw)[:5]: cls.find_columns({}, keys)
+
+
+def measure(fn, repeat, min_time):
+    '''
+    Times fn, calling it often enough per run to take at least min_time
+    seconds. Returns (number, [seconds per call for each run]).
+    '''
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            break
+        number *= 2
+    return number, [t / number for t in timer.repeat(repeat, number)]
+
+
+def run(pattern=None, repeat=5, min_time=0.1):
+    results = {}
+    for name, fn in benchmarks():
+        if pattern is not None and not re.search(pattern, name):
+            continue
+        number, times = measure(fn, repeat, min_time)
+        times.sort()
+        results[name] = {
+            'number': number,
+            'best_us': times[0] * 1e6,
+            'median_us': times[len(times) // 2] * 1e6
+        }
+        print('%-28s %12.2f us' % (name, times[0] * 1e6), file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': int(time.time()),
+            'repeat': repeat,
+            'min_time': min_time
+        },
+        'results': results
+    }
+
+
+def compare(baseline, current):
+    '''
+    Print the ratio of each current best time to the baseline's; above 1
+    is slower.
+    '''
+    for name in sorted(current['results']):
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['best_us']
+        new = current['results'][name]['best_us']
+        print('%-28s %10.2f -> %10.2f us  x%.2f' % (
+            name, old, new, new / old), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-k', '--filter', dest='pattern',
+                        help='only run benchmarks matching this regex')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='minimum seconds per timed run')
+    parser.add_argument('-o', '--output',
+                        help='write results here instead of stdout')
+    parser.add_argument('--compare',
+                        help='results file to compare this run against')
+    args = parser.parse_args(argv)
+
+    results = run(args.pattern, args.repeat, args.min_time)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+    out = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+
+
+if __name__ == '__main__':
+    main()
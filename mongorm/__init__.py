@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from mongorm.database import Database
-from mongorm.document import Field, Index, GeoJSON
-from mongorm.utils import DotDict, JSONEncoder
+from mongorm.document import Cache, Field, Index, GeoJSON
+from mongorm.serialise import set_json_backend
+from mongorm.utils import DotDict, JSONEncoder, LazyDotDict
 
 
 class ValidationError(Exception):
@@ -13,7 +14,10 @@ __all__ = [
     'Database',
     'Field',
     'Index',
+    'Cache',
     'GeoJSON',
     'DotDict',
-    'JSONEncoder'
+    'LazyDotDict',
+    'JSONEncoder',
+    'set_json_backend'
 ]
@@ -0,0 +1,245 @@
+'''
+asyncio flavoured Database and Document.
+
+pymongo's sockets are blocking, so operations are run on a thread pool owned
+by the AsyncDatabase. Size it with max_workers (or pass in an executor) to
+set how many operations can be in flight at once.
+
+This module needs Python 3.7+, and isn't imported by the mongorm package.
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import inspect
+import itertools
+
+from mongorm.database import Database
+from mongorm.document import Document, _hybridmethod
+from mongorm.pipeline import Pipeline
+
+
+async def _run(executor, fn, *args, **kwargs):
+    # Carry the caller's context (and so its session) over to the executor
+    context = contextvars.copy_context()
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+class _ContextLocal(object):
+
+    '''
+    Stands in for the Database's threading.local, following the current
+    task instead of the current thread.
+    '''
+
+    def __init__(self):
+        object.__setattr__(
+            self, '_var', contextvars.ContextVar('mongorm_local'))
+
+    def __getattr__(self, name):
+        try:
+            return self._var.get()[name]
+        except (LookupError, KeyError):
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        d = dict(self._var.get({}))
+        d[name] = value
+        self._var.set(d)
+
+
+class AsyncCursor(object):
+
+    '''
+    Async iterable over a mongorm Cursor. Documents are pulled off the
+    underlying cursor on the executor, a batch at a time.
+    '''
+
+    def __init__(self, cursor, executor, batch=100):
+        self.__cursor__ = cursor
+        self.__executor__ = executor
+        self.__batch__ = batch
+        self.__buffer__ = []
+
+    def __getattr__(self, name):
+        attr = getattr(self.__cursor__, name)
+        if name not in self.__cursor__.CHAINABLE:
+            return attr
+
+        def chain(*args, **kwargs):
+            attr(*args, **kwargs)
+            return self
+
+        return chain
+
+    def __fetch(self):
+        return list(itertools.islice(self.__cursor__, self.__batch__))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.__buffer__:
+            self.__buffer__ = await _run(self.__executor__, self.__fetch)
+            self.__buffer__.reverse()
+        if not self.__buffer__:
+            raise StopAsyncIteration
+        return self.__buffer__.pop()
+
+    async def to_list(self, length=None):
+        rv = []
+        async for doc in self:
+            rv.append(doc)
+            if length is not None and len(rv) >= length:
+                break
+        return rv
+
+    async def count(self, *args, **kwargs):
+        return await _run(
+            self.__executor__, self.__cursor__.count, *args, **kwargs)
+
+    async def to_json(self):
+        return await _run(self.__executor__, self.__cursor__.to_json)
+
+
+class AsyncPipeline(Pipeline):
+
+    '''
+    A Pipeline iterated with async for. The aggregation runs on the
+    executor, as does reading its results.
+    '''
+
+    def __rows(self, prefetch=0):
+        # Lazy, so the aggregate command is only sent from the executor
+        for doc in Pipeline.cursor(self, prefetch):
+            yield doc
+
+    def __iter__(self):
+        raise TypeError('use async for with an AsyncPipeline')
+
+    def __aiter__(self):
+        return AsyncCursor(self.__rows(), self.__document__.__executor__)
+
+    async def cursor(self, prefetch=0):
+        executor = self.__document__.__executor__
+        return AsyncCursor(
+            await _run(executor, Pipeline.cursor, self, prefetch), executor)
+
+    async def to_list(self, length=None):
+        return await self.__aiter__().to_list(length)
+
+    async def to_json(self):
+        return await (await self.cursor()).to_json()
+
+
+def _async_hybrid(name):
+    # Document's hybridmethod, run on the executor
+    method = Document.__dict__[name]
+
+    async def f(cls, doc, *args, **kwargs):
+        return await _run(
+            cls.__executor__, method.f, cls, doc, *args, **kwargs)
+
+    f.__name__ = name
+    f.__doc__ = method.__doc__
+    return _hybridmethod(f)
+
+
+class AsyncDocument(Document):
+
+    '''
+    A Document whose database operations are awaitable. Validation, hooks
+    and collection binding are inherited unchanged from Document, and
+    pipeline() builds an AsyncPipeline.
+    '''
+
+    async def save(self):
+        return await _run(self.__executor__, super().save)
+
+    async def delete(self):
+        return await _run(self.__executor__, super().delete)
+
+    @classmethod
+    async def save_many(cls, *args, **kwargs):
+        return await _run(
+            cls.__executor__, super().save_many, *args, **kwargs)
+
+    @classmethod
+    def find(cls, *args, **kwargs):
+        return AsyncCursor(super().find(*args, **kwargs), cls.__executor__)
+
+    @classmethod
+    async def find_one(cls, *args, **kwargs):
+        return await _run(
+            cls.__executor__, super().find_one, *args, **kwargs)
+
+    @classmethod
+    async def find_columns(cls, *args, **kwargs):
+        return await _run(
+            cls.__executor__, super().find_columns, *args, **kwargs)
+
+    @classmethod
+    async def paginate(cls, *args, **kwargs):
+        return await _run(
+            cls.__executor__, super().paginate, *args, **kwargs)
+
+    @classmethod
+    async def parallel_scan(cls, *args, **kwargs):
+        '''
+        As Document.parallel_scan, but the results are returned as a list
+        (or, with reduce, folded together) rather than streamed.
+        '''
+        scan = super().parallel_scan
+
+        def collect():
+            rv = scan(*args, **kwargs)
+            return list(rv) if inspect.isgenerator(rv) else rv
+
+        return await _run(cls.__executor__, collect)
+
+    @classmethod
+    async def export_jsonl(cls, *args, **kwargs):
+        return await _run(
+            cls.__executor__, super().export_jsonl, *args, **kwargs)
+
+    @classmethod
+    async def import_jsonl(cls, *args, **kwargs):
+        return await _run(
+            cls.__executor__, super().import_jsonl, *args, **kwargs)
+
+    inc = _async_hybrid('inc')
+    push = _async_hybrid('push')
+    pull = _async_hybrid('pull')
+    set_fields = _async_hybrid('set_fields')
+
+    __pipeline__ = AsyncPipeline
+
+
+class AsyncDatabase(Database):
+
+    '''
+    A Database whose Document base is an AsyncDocument. Takes the same
+    arguments as Database, plus either an executor to run operations on or
+    max_workers for the one it creates (defaults to max_pool_size, or
+    pymongo's default connection pool size).
+    '''
+
+    def __init__(self, executor=None, max_workers=None, **kwargs):
+        super().__init__(**kwargs)
+        if executor is None:
+            if max_workers is None:
+                max_workers = kwargs.get('max_pool_size', 100)
+            executor = ThreadPoolExecutor(max_workers)
+        self.__executor__ = executor
+        self.__local__ = _ContextLocal()
+        self.Document = type('Document', (AsyncDocument,), {
+            '__db__': self.__db__,
+            '__database__': self,
+            '__executor__': executor
+        })
+
+    def close(self):
+        self.__executor__.shutdown(wait=True)
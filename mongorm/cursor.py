@@ -0,0 +1,173 @@
+from bson import BSON
+import itertools
+from timeit import default_timer as timer
+
+from mongorm.utils import iter_threaded
+
+
+class Cursor(object):
+
+    '''
+    Wraps a pymongo cursor that yields plain dicts, turning each one into a
+    document as it's read. Without a wrap function, the dicts are handed
+    back untouched.
+
+    If given, done is called once the cursor is exhausted, with a dict of
+    the documents read (count), their BSON size in bytes (size), and the
+    time spent fetching (query) and wrapping (load) them.
+
+    document is the Document class the results belong to, used by to_json.
+
+    With prefetch=N, results are read from the server on a background
+    thread, batch_size at a time, up to N batches ahead of the caller, so
+    that waiting on the server overlaps with whatever the caller does with
+    each document. At most N + 2 batches are held in memory at once. The
+    query time reported to done is then only the time spent waiting for a
+    batch that hadn't arrived yet.
+    '''
+
+    CHAINABLE = [
+        'add_option',
+        'batch_size',
+        'comment',
+        'hint',
+        'limit',
+        'max',
+        'max_scan',
+        'max_time_ms',
+        'min',
+        'remove_option',
+        'rewind',
+        'skip',
+        'sort',
+        'where'
+    ]
+
+    def __init__(self, cursor, wrap=None, done=None, document=None,
+                 prefetch=0, batch_size=100):
+        self.__cursor__ = cursor
+        self.__wrap__ = wrap
+        self.__done__ = done
+        self.__document__ = document
+        self.__prefetch__ = prefetch
+        self.__batch_size__ = batch_size
+        self.__source__ = None
+        self.__stats__ = None
+        if done is not None:
+            self.__stats__ = {'count': 0, 'size': 0, 'query': 0, 'load': 0}
+
+    def __iter__(self):
+        return self
+
+    def __fetch(self):
+        if self.__source__ is None:
+            if self.__prefetch__:
+                self.__source__ = self.__prefetched()
+            else:
+                self.__source__ = self.__cursor__
+        return next(self.__source__)
+
+    def __prefetched(self):
+        cursor = self.__cursor__
+        batch_size = self.__batch_size__
+
+        def fetch(put):
+            while True:
+                batch = list(itertools.islice(cursor, batch_size))
+                if not batch or not put(batch):
+                    return
+
+        batches = iter_threaded([fetch], self.__prefetch__)
+        try:
+            for batch in batches:
+                for doc in batch:
+                    yield doc
+        finally:
+            batches.close()
+
+    def next(self):
+        if self.__stats__ is not None:
+            return self.__timed_next()
+        doc = self.__fetch()
+        if self.__wrap__ is None:
+            return doc
+        return self.__wrap__(doc)
+
+    def __timed_next(self):
+        stats = self.__stats__
+        start = timer()
+        try:
+            doc = self.__fetch()
+        except StopIteration:
+            stats['query'] += timer() - start
+            self.__stats__ = None
+            self.__done__(stats)
+            raise
+        fetched = timer()
+        stats['query'] += fetched - start
+        stats['count'] += 1
+        stats['size'] += len(BSON.encode(doc))
+        if self.__wrap__ is not None:
+            doc = self.__wrap__(doc)
+        stats['load'] += timer() - fetched
+        return doc
+
+    __next__ = next
+
+    def __getitem__(self, index):
+        rv = self.__cursor__[index]
+        if isinstance(index, slice):
+            return self
+        if self.__wrap__ is None:
+            return rv
+        return self.__wrap__(rv)
+
+    def __getattr__(self, name):
+        attr = getattr(self.__cursor__, name)
+        if name not in self.CHAINABLE:
+            return attr
+
+        def chain(*args, **kwargs):
+            attr(*args, **kwargs)
+            return self
+
+        return chain
+
+    def batch_size(self, batch_size):
+        self.__cursor__.batch_size(batch_size)
+        self.__batch_size__ = batch_size
+        return self
+
+    def rewind(self):
+        self.__stop()
+        self.__cursor__.rewind()
+        return self
+
+    def close(self):
+        self.__stop()
+        self.__cursor__.close()
+
+    def __stop(self):
+        # Shuts down the prefetch thread, if there is one
+        if self.__source__ is not None and \
+                self.__source__ is not self.__cursor__:
+            self.__source__.close()
+        self.__source__ = None
+
+    def clone(self):
+        return Cursor(self.__cursor__.clone(), self.__wrap__, self.__done__,
+                      self.__document__, self.__prefetch__,
+                      self.__batch_size__)
+
+    def to_json(self):
+        '''
+        The remaining results as a single JSON array, as dump_json_many.
+        '''
+        return self.__document__.dump_json_many(self)
+
+    def iter_json(self, chunk_size=100):
+        '''
+        The remaining results as a JSON array in pieces of up to chunk_size
+        documents, as iter_json_many.
+        '''
+        return self.__document__.iter_json_many(self, chunk_size)
@@ -1,6 +1,57 @@
-from pymongo import MongoClient
+from bson.son import SON
+from collections import OrderedDict
+from contextlib import contextmanager
+from pymongo import MongoClient, uri_parser
+import pymongo
+import threading
 
 from mongorm.document import Document
+from mongorm.memory import MemoryClient
+from mongorm.utils import LRUCache
+
+
+def _index_spec(args, kwargs, background=False):
+    '''
+    Turn ensure_index-style arguments into a createIndexes index document.
+    '''
+
+    keys = args[0]
+    if not isinstance(keys, list):
+        keys = [(keys, 1)]
+
+    spec = SON([('key', SON(keys))])
+    spec['name'] = kwargs.get(
+        'name', '_'.join('%s_%s' % (k, d) for k, d in keys))
+
+    for k, v in kwargs.items():
+        # cache_for/ttl only affect pymongo's ensure_index bookkeeping
+        if k in ('name', 'cache_for', 'ttl'):
+            continue
+        elif k == 'drop_dups':
+            k = 'dropDups'
+        elif k == 'bucket_size':
+            k = 'bucketSize'
+        spec[k] = v
+
+    if background:
+        spec['background'] = True
+
+    return spec
+
+
+def _replica_set(uri, client_kwargs):
+    '''
+    The replica set name given in the client arguments or the uri, if any.
+    '''
+
+    options = dict(client_kwargs)
+    if uri is not None:
+        options.update(uri_parser.parse_uri(uri)['options'])
+    for k, v in options.items():
+        # pymongo 2.x lowercases uri options
+        if k.lower() == 'replicaset':
+            return v
+    return None
 
 
 class Database(object):
@@ -9,23 +60,74 @@ class Database(object):
     Represent a MongoDB database, backed by pymongo's MongoClient
     '''
 
+    BACKENDS = {
+        'mongo': MongoClient,
+        'memory': MemoryClient
+    }
+
+    # pymongo 2.x's MongoClient only ever talks to a replica set's primary,
+    # so secondary read preferences need MongoReplicaSetClient; from 3.0,
+    # MongoClient handles them itself
+    REPLICA_SET_BACKENDS = {}
+    if pymongo.version_tuple[0] < 3:
+        REPLICA_SET_BACKENDS['mongo'] = pymongo.MongoReplicaSetClient
+
+    OPTIONS = [
+        'backend',
+        'db',
+        'defer_indexes',
+        'host',
+        'port',
+        'uri'
+    ]
+
     def __init__(self, **kwargs):
         '''
         Initialise
+
+        With defer_indexes=True, indexes declared in __indices__ aren't
+        created when a class is defined, only when sync_indexes is called.
+
+        backend='memory' keeps everything in-process instead of connecting
+        to a server (see mongorm.memory), for tests and benchmarks.
+
+        Any other keyword arguments are handed to MongoClient, e.g.
+        max_pool_size, connectTimeoutMS, socketTimeoutMS, waitQueueTimeoutMS
+        or read_preference. On pymongo 2.x, naming a replicaSet (here or in
+        the uri) connects with MongoReplicaSetClient instead, so that reads
+        can go to secondaries.
         '''
+        self.__defer_indexes__ = kwargs.get('defer_indexes', False)
+        self.__indexed__ = []
+        self.__listeners__ = []
+        backend = kwargs.get('backend', 'mongo')
+        if backend not in self.BACKENDS:
+            raise ValueError('unknown backend: %s' % backend)
+        client_class = self.BACKENDS[backend]
+        client_kwargs = dict(
+            (k, v) for k, v in kwargs.items() if k not in self.OPTIONS
+        )
+        if backend in self.REPLICA_SET_BACKENDS and \
+                _replica_set(kwargs.get('uri'), client_kwargs):
+            client_class = self.REPLICA_SET_BACKENDS[backend]
         if 'uri' in kwargs:
-            self.__client__ = MongoClient(kwargs['uri'])
+            self.__client__ = client_class(kwargs['uri'], **client_kwargs)
             if 'db' in kwargs:
                 self.__db__ = self.__client__[kwargs['db']]
             else:
                 self.__db__ = self.__client__.get_default_database()
         else:
-            self.__client__ = MongoClient(
+            self.__client__ = client_class(
                 kwargs.get('host', 'localhost'),
-                kwargs.get('port', 27017)
+                kwargs.get('port', 27017),
+                **client_kwargs
             )
             self.__db__ = self.__client__[kwargs.get('db', 'test')]
-        self.Document = type('Document', (Document,), {'__db__': self.__db__})
+        self.__local__ = threading.local()
+        self.Document = type('Document', (Document,), {
+            '__db__': self.__db__,
+            '__database__': self
+        })
 
     def authenticate(self, *args, **kwargs):
         self.__client__.authenticate(*args, **kwargs)
@@ -44,6 +146,76 @@ class Database(object):
     def get_collections(self, include_system_collections=False):
         return self.__db__.collection_names(include_system_collections)
 
+    def register_indices(self, document):
+        '''
+        Called for each Document class that declares __indices__; creates
+        them straight away unless index creation is deferred.
+        '''
+        self.__indexed__.append(document)
+        if not self.__defer_indexes__:
+            for args, kwargs in document.__indices__:
+                document.ensure_index(*args, **kwargs)
+
+    def sync_indexes(self, background=False):
+        '''
+        Create any indexes declared by this database's classes that don't
+        exist yet, with one createIndexes command per collection. With
+        background=True, the server builds them in the background.
+        Returns the names of the indexes created, by collection.
+        '''
+        indices = OrderedDict()
+        for document in self.__indexed__:
+            indices.setdefault(document.__collection__, []).extend(
+                document.__indices__)
+
+        created = {}
+        for collection, declared in indices.items():
+            existing = set(self.__db__[collection].index_information())
+            specs = []
+            for args, kwargs in declared:
+                spec = _index_spec(args, kwargs, background)
+                if spec['name'] not in existing:
+                    existing.add(spec['name'])
+                    specs.append(spec)
+            if specs:
+                self.__db__.command(
+                    'createIndexes', collection, indexes=specs)
+                created[collection] = [spec['name'] for spec in specs]
+
+        return created
+
+    def add_listener(self, listener):
+        '''
+        Call listener with an event for each operation by this database's
+        documents. Events are DotDicts with the operation (op), collection,
+        document class name, duration and phases (both in seconds), along
+        with anything specific to the operation, such as its size in bytes.
+        '''
+        self.__listeners__.append(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners__.remove(listener)
+
+    @contextmanager
+    def session(self, maxsize=1000):
+        '''
+        Within the block, documents loaded by _id are kept in an identity
+        map, so that loading the same document again gives back the same
+        instance without going to the server. The map holds up to maxsize
+        documents, and is local to the current thread.
+        '''
+        previous = self.identity_map
+        identity_map = LRUCache(maxsize)
+        self.__local__.identity_map = identity_map
+        try:
+            yield identity_map
+        finally:
+            self.__local__.identity_map = previous
+
+    @property
+    def identity_map(self):
+        return getattr(self.__local__, 'identity_map', None)
+
     @property
     def host(self):
         return self.__client__.host
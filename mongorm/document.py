@@ -1,11 +1,41 @@
+from bson import BSON, json_util
 from bson.objectid import ObjectId
 from inflection import (
     camelize as camelise,
     underscore
 )
-import json
+from pymongo.errors import BulkWriteError, OperationFailure
+from collections import OrderedDict, namedtuple
+import base64
+import binascii
+import datetime
+import functools
+import numbers
+from timeit import default_timer as timer
 
-from mongorm.utils import DotDict, JSONEncoder
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mongorm import serialise
+from mongorm.cursor import Cursor
+from mongorm.pipeline import Pipeline
+from mongorm.record import Record, _loader, record_class
+from mongorm.utils import (
+    DotDict,
+    InflectionCache,
+    KeyMap,
+    LazyDotDict,
+    LRUCache,
+    iter_threaded
+)
+
+# Process-wide caches for key inflection in load_dict/dump_dict
+underscore_key = InflectionCache(underscore)
+camelise_key = InflectionCache(
+    lambda k: camelise(k, uppercase_first_letter=False)
+)
 
 
 class Field(object):
@@ -72,6 +102,452 @@ def Index(*args, **kwargs):
     return args, kwargs
 
 
+def Cache(max_entries=1000, ttl=60):
+    return max_entries, ttl
+
+
+def _cache_key(spec):
+    '''
+    Key for a find_one spec made up only of plain equality matches, or None
+    if the spec isn't one that can be cached.
+    '''
+
+    if not isinstance(spec, dict):
+        spec = {'_id': spec}
+
+    items = []
+    for k, v in spec.items():
+        if k[:1] == '$' or isinstance(v, (dict, list)) or \
+                hasattr(v, 'pattern'):
+            return None
+        # True == 1 in Python, but the server tells them apart
+        items.append((k, type(v), v))
+
+    rv = tuple(sorted(items))
+    try:
+        hash(rv)
+    except TypeError:
+        return None
+    return rv
+
+
+def _identity_key(cls, _id):
+    '''
+    Key for a document in the identity map, or None if its _id (e.g. a
+    compound one) can't be hashed, in which case it's left out of the map.
+    '''
+
+    try:
+        hash(_id)
+    except TypeError:
+        return None
+    return cls, _id
+
+
+# A page of paginate results. next_token is None on the last page, and total
+# None unless counted
+Page = namedtuple('Page', ['documents', 'next_token', 'total'])
+
+
+def _page_token(key, direction, doc):
+    '''
+    Encode where a page ended: the sort key, its direction, and the last
+    document's value for it and _id.
+    '''
+
+    if isinstance(doc, Record):
+        doc = Record.to_dict(doc)
+    position = {
+        'k': key,
+        'd': direction,
+        'v': _get_path(key.split('.'), doc),
+        'i': doc['_id']
+    }
+    return base64.urlsafe_b64encode(
+        json_util.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def _page_after(key, direction, token):
+    '''
+    The query for everything after the position in token, in the order
+    (key, direction), (_id, direction). Documents missing key sort as null,
+    first in ascending order.
+    '''
+
+    try:
+        position = json_util.loads(
+            base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        value, _id = position['v'], position['i']
+    except (AttributeError, KeyError, TypeError, ValueError,
+            binascii.Error):
+        raise ValueError('invalid page token')
+    if position.get('k') != key or position.get('d') != direction:
+        raise ValueError('page token is for a different sort order')
+
+    op = '$gt' if direction > 0 else '$lt'
+    if key == '_id':
+        return {'_id': {op: _id}}
+
+    after = [
+        {key: value, '_id': {op: _id}}
+    ]
+    if value is not None:
+        after.append({key: {op: value}})
+        if direction < 0:
+            after.append({key: None})
+    elif direction > 0:
+        after.append({key: {'$ne': None}})
+    return {'$or': after}
+
+
+class _FieldError(Exception):
+
+    '''
+    Raised by compiled field checks; carries the failing path in reverse
+    so that it's only ever built when something actually fails.
+    '''
+
+    def __init__(self, exc_type):
+        super(_FieldError, self).__init__()
+        self.exc_type = exc_type
+        self.path = []
+
+
+def _compile_spec(spec):
+    '''
+    Turn a __fields__-style spec into a closure that checks a value against
+    it, so the spec itself is only walked once.
+    '''
+
+    if type(spec) is dict:
+
+        try:
+            items = spec.iteritems()
+        except AttributeError:
+            items = spec.items()
+
+        checks = tuple(
+            (k, _compile_spec(v), type(v) is dict) for k, v in items
+        )
+
+        def check(dct, only=None):
+            if dct is None:
+                return DotDict()
+
+            if type(dct) is dict:
+                dct = DotDict(dct)
+
+            for k, f, nested in checks:
+                sub = None
+                if only is not None:
+                    if k not in only:
+                        continue
+                    if nested and isinstance(only, dict):
+                        sub = only[k]
+                current = dct.get(k, None)
+                try:
+                    if current is None and nested and k not in dct:
+                        value = f(DotDict())
+                    elif sub is not None and sub is not True:
+                        value = f(current, sub)
+                    else:
+                        value = f(current)
+                except _FieldError as e:
+                    e.path.append('.' + k)
+                    raise
+
+                if value is None or value == {}:
+                    if k in dct:
+                        del dct[k]
+                elif value is not current:
+                    dct[k] = value
+
+            return dct
+
+        return check
+
+    elif type(spec) is list:
+
+        f = _compile_spec(spec[0])
+
+        def check(lst):
+            if lst is None:
+                return []
+
+            for i, v in enumerate(lst):
+                try:
+                    lst[i] = f(v)
+                except _FieldError as e:
+                    e.path.append('[' + str(i) + ']')
+                    raise
+
+            return lst
+
+        return check
+
+    elif type(spec) is tuple:
+
+        req, typ, default = spec
+
+        def check(value):
+            if value is None:
+                if not req:
+                    return None
+                if default is None:
+                    raise _FieldError(KeyError)
+                value = default
+
+            if not issubclass(type(value), typ):
+                try:
+                    return typ(value)
+                except:
+                    raise _FieldError(TypeError)
+
+            return value
+
+        return check
+
+    else:
+
+        return lambda value: None
+
+
+def _spec_type(spec, path):
+    '''
+    The type declared for a dotted path in a __fields__-style spec, or None
+    if it isn't declared as a single value.
+    '''
+
+    for k in path.split('.'):
+        if type(spec) is not dict or k not in spec:
+            return None
+        spec = spec[k]
+
+    if type(spec) is tuple:
+        return spec[1]
+    return None
+
+
+def _column(values, typ):
+    '''
+    Turn a list of values into a numpy array, typed after the declared
+    type where that's numeric and every value is of that type (or, for
+    floats, an int). Missing ints become NaN in a float array. Anything
+    else, including mismatched values, goes in an object array as-is.
+    '''
+
+    present = set(type(v) for v in values if v is not None)
+    missing = None in values
+    dtype = object
+    if typ is bool and present <= set([bool]) and not missing:
+        dtype = numpy.bool_
+    elif typ is int and present <= set([int]):
+        dtype = numpy.float64 if missing else numpy.int64
+    elif typ is float and present <= set([int, float]):
+        dtype = numpy.float64
+
+    if dtype is not object:
+        try:
+            return numpy.array(
+                [numpy.nan if v is None else v for v in values], dtype=dtype)
+        except (OverflowError, TypeError, ValueError):
+            pass
+
+    rv = numpy.empty(len(values), dtype=object)
+    rv[:] = values
+    return rv
+
+
+def _get_path(keys, d):
+    for k in keys:
+        if not isinstance(d, dict):
+            return None
+        d = d.get(k)
+    return d
+
+
+def _spec_keys(spec, keys=None):
+    '''
+    Collect every key name used anywhere in a __fields__-style spec.
+    '''
+
+    if keys is None:
+        keys = set()
+
+    if type(spec) is dict:
+        for k, v in spec.items():
+            keys.add(k)
+            _spec_keys(v, keys)
+    elif type(spec) is list:
+        _spec_keys(spec[0], keys)
+
+    return keys
+
+
+def compile_fields(spec):
+    '''
+    Compile a __fields__-style spec into a validator that takes a document
+    and raises KeyError or TypeError with the offending path on failure.
+    The validator can be limited to a set of top-level keys with only, or
+    to a tree of keys given as nested dicts, with True for keys to check in
+    full.
+    '''
+
+    check = _compile_spec(spec)
+
+    def validate(dct, only=None):
+        try:
+            check(dct, only)
+        except _FieldError as e:
+            raise e.exc_type(''.join(reversed(e.path)))
+
+    return validate
+
+
+def _loaded_keys(loaded, current):
+    '''
+    The validation tree for a partly loaded field: True for anything
+    replaced or added since loading, and the keys present otherwise.
+    '''
+
+    if not isinstance(loaded, dict) or not isinstance(current, dict):
+        return True
+    return dict(
+        (k, _loaded_keys(loaded[k], v) if k in loaded else True)
+        for k, v in dict.items(current)
+    )
+
+
+def _range_type(value):
+    '''
+    What MongoDB compares a value against in range queries: numbers of any
+    type with each other, anything else only with its own type.
+    '''
+
+    if isinstance(value, numbers.Number) and not isinstance(value, bool):
+        return numbers.Number
+    return type(value)
+
+
+def _rename_keys(value, key):
+    '''
+    A copy of value with every dict key passed through key, leaving the
+    values themselves (ObjectIds included) as they are.
+    '''
+
+    if type(value) is dict:
+        return dict((key(k), _rename_keys(v, key)) for k, v in value.items())
+    elif type(value) is list:
+        return [_rename_keys(v, key) for v in value]
+    return value
+
+
+def _snapshot(value):
+    '''
+    Plain deep copy of a document's dicts and lists, to diff against later.
+    '''
+
+    if isinstance(value, dict):
+        return dict((k, _snapshot(v)) for k, v in dict.items(value))
+    elif isinstance(value, list):
+        return [_snapshot(v) for v in value]
+    else:
+        return value
+
+
+def _diff(old, new, updates, removals, prefix=''):
+    '''
+    Collect the dotted paths that differ between two documents, as $set and
+    $unset operands. Subdocuments are descended into; anything else that
+    changed (including lists) is replaced wholesale.
+    '''
+
+    for k, v in dict.items(new):
+        if k not in old:
+            updates[prefix + k] = v
+            continue
+
+        o = old[k]
+        if o is v:
+            continue
+
+        if isinstance(o, dict) and isinstance(v, dict):
+            if o != v:
+                _diff(o, v, updates, removals, prefix + k + '.')
+        elif o != v or \
+                (type(o) is not type(v) and not isinstance(v, list)):
+            updates[prefix + k] = v
+
+    for k in old:
+        if k not in new:
+            removals[prefix + k] = ''
+
+
+def _set_path(keys, d, value):
+    for k in keys[:-1]:
+        if not isinstance(d.get(k), dict):
+            d[k] = {}
+        d = d[k]
+    d[keys[-1]] = value
+
+
+def _replace_path(keys, d, value):
+    '''
+    A copy of d with value at the path, copying only the dicts on the way
+    there; d itself is left alone, as snapshots may be shared.
+    '''
+    rv = dict(d) if isinstance(d, dict) else {}
+    if len(keys) == 1:
+        rv[keys[0]] = value
+    else:
+        rv[keys[0]] = _replace_path(keys[1:], rv.get(keys[0]), value)
+    return rv
+
+
+def _apply_locally(op, current, value):
+    '''
+    What an atomic update does to a field's value, as far as can be told
+    without asking the server. $pull only removes values equal to value.
+    '''
+
+    if op == '$inc':
+        return (current or 0) + value
+    elif op == '$push':
+        return list(current or []) + [value]
+    elif op == '$pull':
+        return [v for v in current or [] if v != value]
+    return value
+
+
+def _inc_args(field, n=1):
+    return field if isinstance(field, dict) else {field: n}
+
+
+def _array_args(field, value):
+    return {field: value}
+
+
+def _set_args(fields=None, **kwargs):
+    rv = dict(fields or {})
+    rv.update(kwargs)
+    return rv
+
+
+class _hybridmethod(object):
+
+    '''
+    A method that works on both instances and the class. The function is
+    passed the class, then the instance (None when called on the class).
+    '''
+
+    def __init__(self, f):
+        self.f = f
+        self.__doc__ = f.__doc__
+
+    def __get__(self, obj, cls):
+        return functools.partial(self.f, cls, obj)
+
+
 class BaseDocumentMeta(type):
 
     '''
@@ -94,25 +570,71 @@ class BaseDocumentMeta(type):
         'find_and_modify'
     ]
 
+    def __new__(mcs, clsname, bases, dct):
+        # Lazy documents pick up LazyDotDict's item handling
+        if dct.get('__lazy__') and \
+                not any(issubclass(b, LazyDotDict) for b in bases):
+            bases = bases + (LazyDotDict, )
+        return super(BaseDocumentMeta, mcs).__new__(mcs, clsname, bases, dct)
+
     def __init__(self, clsname, bases, dct):
         super(BaseDocumentMeta, self).__init__(clsname, bases, dct)
+        if '__fields__' in dct:
+            self.__compile_fields(dct['__fields__'])
+        elif getattr(self, '__compact__', False):
+            # Inherited records would load into the parent class
+            if getattr(self, '__fields__', None) is None:
+                raise TypeError('compact documents must declare __fields__')
+            self.__compile_record(self.__fields__)
+        if '__cache__' in dct:
+            max_entries, ttl = dct['__cache__']
+            self.__query_cache__ = LRUCache(max_entries, ttl)
+        self.__counts__ = LRUCache(100, getattr(self, '__count_ttl__', None))
         if '__collection__' not in dct:
             self.__collection__ = underscore(clsname)
         # Set the collection object if we need to
         try:
             self.__coll__ = self.__db__[self.__collection__]
+            if self.__read_preference__ is not None:
+                self.__coll__.read_preference = self.__read_preference__
+            if self.__write_concern__ is not None:
+                self.__coll__.write_concern = self.__write_concern__
 
             for fn in self.INHERIT_FROM_COLLECTION:
                 setattr(self, fn, getattr(self.__coll__, fn))
             if '__indices__' in self.__dict__:
-                for v in self.__indices__:
-                    varg, vkwarg = v
-                    self.ensure_index(*varg, **vkwarg)
+                if self.__database__ is not None:
+                    self.__database__.register_indices(self)
+                else:
+                    for v in self.__indices__:
+                        varg, vkwarg = v
+                        self.ensure_index(*varg, **vkwarg)
 
         except AttributeError:
             # Initial declaration, it won't have an injected __db__
             pass
 
+    def __setattr__(self, name, value):
+        super(BaseDocumentMeta, self).__setattr__(name, value)
+        # Keep everything derived from the spec in step with a reassignment
+        if name == '__fields__':
+            self.__compile_fields(value)
+
+    def __compile_fields(self, spec):
+        self.__field_validator__ = compile_fields(spec)
+        keys = _spec_keys(spec)
+        self.__camelise_key__ = KeyMap(keys, camelise_key)
+        self.__underscore_key__ = KeyMap(
+            set(camelise_key(k) for k in keys),
+            underscore_key
+        )
+        if self.__compact__:
+            self.__compile_record(spec)
+
+    def __compile_record(self, spec):
+        self.__record__ = record_class(
+            self.__name__ + 'Record', spec, self, self.__camelise_key__)
+
 
 # This is the only metaclass definition that works with both python3 and
 # python2
@@ -121,50 +643,142 @@ BaseDocument = BaseDocumentMeta('BaseDocument', (DotDict, ), {})
 
 class Document(BaseDocument):
 
+    __camelise_key__ = camelise_key
+    __underscore_key__ = underscore_key
+
+    # Documents loaded from the collection remember what they looked like,
+    # so that save() only needs to send what has changed since
+    __track_changes__ = True
+    __snapshot__ = None
+
+    # The mongorm Database this class belongs to, injected with __db__
+    __database__ = None
+
+    # Built from __cache__, if the class declares one
+    __query_cache__ = None
+
+    # How long paginate(count=True) reuses a count for, in seconds
+    __count_ttl__ = 60
+
+    # Applied to the class's collection, e.g. ReadPreference.SECONDARY for
+    # reporting models, or {'w': 'majority'}; None keeps the client's
+    __read_preference__ = None
+    __write_concern__ = None
+
+    # For documents loaded with a projection, the top-level keys that were
+    # loaded in full
+    __partial__ = None
+
+    # With __compact__ set, find(compact=True) loads __slots__ records of
+    # __record__, generated from __fields__, rather than documents
+    __compact__ = False
+    __record__ = None
+
+    # The Pipeline class pipeline() builds
+    __pipeline__ = Pipeline
+
     def __init__(self, *args, **kwargs):
         super(Document, self).__init__()
         d = dict(*args, **kwargs)
         self.load_dict(d)
 
     @staticmethod
-    def __dict_key_process(dct, f, *fargs, **fkwargs):
+    def __dict_key_process(dct, f, dump=False):
+        # Builds new containers rather than rewriting keys in place, since
+        # lazy documents share their nested dicts with whatever they were
+        # loaded from. Dumping also turns dates into ISO 8601, so the JSON
+        # encoder never has to fall back on a per-value default
         if type(dct) is dict:
-            for k in dct.keys():
-                _k = f(k, *fargs, **fkwargs)
-                dct[_k] = Document.__dict_key_process(
-                    dct[k], f, *fargs, **fkwargs)
-                if _k != k:
-                    del dct[k]
-            return dct
+            rv = {}
+            for k, v in dct.items():
+                rv[f(k)] = Document.__dict_key_process(v, f, dump)
+            return rv
         elif type(dct) is list:
-            for i, v in enumerate(dct):
-                dct[i] = Document.__dict_key_process(
-                    dct[i], f, *fargs, **fkwargs)
-            return dct
-        else:
-            return dct if type(dct) is not ObjectId else str(dct)
+            return [Document.__dict_key_process(v, f, dump) for v in dct]
+        elif type(dct) is ObjectId:
+            return str(dct)
+        elif dump and isinstance(dct, (datetime.datetime, datetime.date)):
+            return dct.isoformat()
+        return dct
 
     def dump_dict(self):
         rv = {}
         rv.update(self)
-        Document.__dict_key_process(rv, camelise, uppercase_first_letter=False)
-        return rv
+        return Document.__dict_key_process(rv, self.__camelise_key__, True)
 
     def dump_json(self):
+        listeners = self.__listeners()
+        start = timer()
         rv = self.dump_dict()
-        return JSONEncoder().encode(rv)
+        converted = timer()
+        rv = serialise.backend.dumps(rv)
+        if listeners:
+            self.__emit(listeners, 'dump_json', timer() - start, {
+                'convert': converted - start,
+                'encode': timer() - converted
+            }, size=len(rv))
+        return rv
 
     def load_dict(self, d):
         _d = {}
         _d.update(d)
-        _d = Document.__dict_key_process(_d, underscore)
+        _d = Document.__dict_key_process(_d, self.__underscore_key__)
         self.update(_d)
         if '_id' in self:
             self._id = ObjectId(self._id)
 
     def load_json(self, s):
-        d = json.loads(s)
+        listeners = self.__listeners()
+        start = timer()
+        d = serialise.backend.loads(s)
+        decoded = timer()
         self.load_dict(d)
+        if listeners:
+            self.__emit(listeners, 'load_json', timer() - start, {
+                'decode': decoded - start,
+                'convert': timer() - decoded
+            }, size=len(s))
+
+    @classmethod
+    def dump_json_many(cls, docs):
+        '''
+        Dump documents (or raw dicts, or compact records) as a single JSON
+        array, each as dump_json would, with one encoder call.
+        '''
+        return serialise.backend.dumps(cls.__dump_dicts(docs))
+
+    @classmethod
+    def iter_json_many(cls, docs, chunk_size=100):
+        '''
+        As dump_json_many, but yields the array in pieces of up to
+        chunk_size documents, e.g. to stream a response.
+        '''
+        backend = serialise.backend
+        batch = []
+        sep = '['
+        for d in docs:
+            batch.append(d)
+            if len(batch) >= chunk_size:
+                yield sep + backend.dumps(cls.__dump_dicts(batch))[1:-1]
+                sep = backend.separator
+                batch = []
+        if batch:
+            yield sep + backend.dumps(cls.__dump_dicts(batch))[1:-1]
+            sep = backend.separator
+        yield ']' if sep != '[' else '[]'
+
+    @classmethod
+    def __dump_dicts(cls, docs):
+        key = cls.__camelise_key__
+        rv = []
+        for d in docs:
+            if isinstance(d, Record):
+                rv.append(Record.dump_dict(d))
+            else:
+                _d = {}
+                _d.update(d)
+                rv.append(Document.__dict_key_process(_d, key, True))
+        return rv
 
     @classmethod
     def from_json(cls, s):
@@ -174,6 +788,63 @@ class Document(BaseDocument):
             del rv['_id']
         return rv
 
+    @classmethod
+    def export_jsonl(cls, fileobj, *args, **kwargs):
+        '''
+        Write the documents matching a query to fileobj as newline-delimited
+        MongoDB extended JSON (bson.json_util), with keys camelCased as in
+        dump_json, so that ObjectIds, datetimes and the like survive the
+        round trip through import_jsonl. Documents are streamed from the
+        cursor one at a time. Returns the number written.
+        '''
+        key = cls.__camelise_key__
+        n = 0
+        # Document's own find, so subclasses (e.g. AsyncDocument) may wrap it
+        for d in Document.find.__func__(cls, *args, raw=True, **kwargs):
+            fileobj.write(json_util.dumps(_rename_keys(d, key)) + '\n')
+            n += 1
+        return n
+
+    @classmethod
+    def import_jsonl(cls, fileobj, batch_size=1000, ordered=True):
+        '''
+        Load newline-delimited JSON, as written by export_jsonl, and save it
+        with save_many, batch_size documents at a time. Returns (n, errors),
+        where n is the number of documents written and errors maps the
+        index of each failed document in the input to its exception.
+        '''
+        n = 0
+        errors = {}
+        batch = []
+        offset = 0
+
+        def flush():
+            ids, errs = Document.save_many.__func__(
+                cls, batch, batch_size, ordered)
+            for i, e in errs.items():
+                errors[offset + i] = e
+            return len([_id for _id in ids if _id is not None])
+
+        for line in fileobj:
+            line = line.strip()
+            if not line:
+                continue
+            doc = cls()
+            doc.update(_rename_keys(
+                json_util.loads(line), cls.__underscore_key__))
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                n += flush()
+                if ordered and errors:
+                    return n, errors
+                offset += len(batch)
+                batch = []
+
+        if batch:
+            n += flush()
+
+        return n, errors
+
     def validate(self):
         pass
 
@@ -183,90 +854,756 @@ class Document(BaseDocument):
     def post_save(self):
         pass
 
-    @staticmethod
-    def __field_verify(spec, dct, _k=''):
+    def validate_fields_extra(self, spec):
+        compile_fields(spec)(self)
 
-        if type(spec) is dict:
+    def validate_fields(self):
+        if '__fields__' in self.__class__.__dict__:
+            self.__class__.__field_validator__(self, self.__validated_keys())
 
-            if dct is None:
-                return DotDict()
+    def __validated_keys(self):
+        '''
+        What validate_fields checks on a partial document: the fields that
+        were loaded in full, and any set or removed since loading. Fields
+        that were only partly loaded are checked as far as they're present,
+        so that defaults aren't written over what wasn't loaded.
+        '''
+        if self.__partial__ is None:
+            return None
+        snapshot = self.__snapshot__ or {}
+        only = dict((k, True) for k in self.__partial__)
+        for k in set(dict.keys(self)) | set(snapshot):
+            if k not in only:
+                only[k] = _loaded_keys(snapshot.get(k), dict.get(self, k))
+        return only
 
-            try:
-                f = spec.iteritems
-            except AttributeError:
-                f = spec.items
-
-            for k, v in f():
-                dct[k] = Document.__field_verify(
-                    v,
-                    dct.get(k, DotDict() if type(v) is dict else None),
-                    _k + '.' + k
-                )
-                if dct[k] is None or dct[k] == {}:
-                    del dct[k]
+    def changes(self):
+        '''
+        Returns the $set/$unset update that would bring the stored document
+        up to date, or None if the document wasn't loaded from the
+        collection and has to be saved in full.
+        '''
+        if self.__snapshot__ is None or '_id' not in self:
+            return None
 
-            return dct
+        updates = {}
+        removals = {}
+        _diff(self.__snapshot__, self, updates, removals)
 
-        elif type(spec) is list:
+        rv = {}
+        if updates:
+            rv['$set'] = updates
+        if removals:
+            rv['$unset'] = removals
+        return rv
 
-            if dct is None:
-                return []
+    def __check_partial(self):
+        if self.__partial__ is not None:
+            raise ValueError(
+                'partially loaded documents can only save their changes')
 
-            list_spec = spec[0]
+    def __saved(self, changes):
+        if changes:
+            self.__snapshot__ = _snapshot(self)
+        identity_map = self.__identity_map()
+        key = _identity_key(self.__class__, self._id)
+        if identity_map is not None and key is not None:
+            identity_map.set(key, self)
+        self.__uncache()
 
-            for i, v in enumerate(dct):
-                dct[i] = Document.__field_verify(
-                    list_spec,
-                    v,
-                    _k + '[' + str(i) + ']'
-                )
+    def __uncache(self):
+        query_cache = self.__query_cache__
+        if query_cache is not None:
+            _id = self._id
+            query_cache.discard_if(lambda key, d: d['_id'] == _id)
 
-            return dct
+    def save(self):
+        listeners = self.__listeners()
+        start = timer()
+        self.pre_save()
+        self.validate_fields()
+        self.validate()
+        validated = timer()
+        changes = self.changes()
+        diffed = timer()
+        if changes is None:
+            self.__check_partial()
+            self._id = self.__coll__.save(self)
+        elif changes:
+            rv = self.__coll__.update({'_id': self._id}, changes)
+            # Unacknowledged writes (w=0) return None
+            if rv is not None and not rv.get('n'):
+                raise ValueError('document no longer exists')
+        written = timer()
+        self.__saved(changes)
+        self.post_save()
+        if listeners:
+            self.__emit(listeners, 'save', timer() - start, {
+                'validate': validated - start,
+                'diff': diffed - validated,
+                'write': written - diffed
+            }, size=len(BSON.encode(changes or self)), full=changes is None)
 
-        elif type(spec) is tuple:
+    @classmethod
+    def save_many(cls, docs, batch_size=1000, ordered=True):
+        '''
+        Save documents in batched writes rather than one round trip each.
+        Hooks and validation run as in save(), and documents that fail them
+        aren't written; with ordered=True, nothing after the first failure
+        is written either.
 
-            req, typ, default = spec
+        Returns (ids, errors): ids lines up with docs, with None for any
+        document that wasn't written, and errors maps indices in docs to
+        the exception for that document. As with save(), loaded documents
+        deleted from the collection since fail with a ValueError.
+        '''
+        listeners = cls.__listeners()
+        began = timer()
+        docs = list(docs)
+        ids = [None] * len(docs)
+        errors = {}
 
-            if req and dct is None:
-                if default is None:
-                    raise KeyError(_k)
+        pending = []
+        changes = {}
+        for i, doc in enumerate(docs):
+            try:
+                doc.pre_save()
+                doc.validate_fields()
+                doc.validate()
+                changes[i] = doc.changes()
+                if changes[i] is None:
+                    doc.__check_partial()
+            except Exception as e:
+                errors[i] = e
+                if ordered:
+                    break
+            else:
+                pending.append(i)
+        validated = timer()
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            if ordered:
+                bulk = cls.__coll__.initialize_ordered_bulk_op()
+            else:
+                bulk = cls.__coll__.initialize_unordered_bulk_op()
+
+            inserted = set()
+            for i in batch:
+                doc = docs[i]
+                if changes[i]:
+                    bulk.find({'_id': doc._id}).update_one(changes[i])
+                elif changes[i] is not None:
+                    continue
+                elif '_id' in doc:
+                    bulk.find({'_id': doc._id}).upsert().replace_one(doc)
                 else:
-                    dct = default
+                    doc._id = ObjectId()
+                    inserted.add(i)
+                    bulk.insert(doc)
 
-            if dct is not None:
+            # Unchanged documents don't go into the bulk op, so its indices
+            # need mapping back onto the batch
+            written = [i for i in batch if changes[i] != {}]
 
-                if not issubclass(type(dct), typ):
-                    try:
-                        return typ(dct)
-                    except:
-                        raise TypeError(_k)
+            failed = set()
+            result = None
+            try:
+                if written:
+                    result = bulk.execute()
+            except BulkWriteError as e:
+                if not e.details.get('writeErrors'):
+                    raise
+                result = e.details
+                for err in e.details['writeErrors']:
+                    i = written[err['index']]
+                    errors[i] = OperationFailure(err['errmsg'], err['code'])
+                    failed.add(i)
+                if ordered:
+                    # Everything after the failing write was skipped
+                    last = max(batch.index(i) for i in failed)
+                    failed.update(batch[last:])
 
-            return dct
+            updated = [i for i in batch if changes[i] and i not in failed]
+            # Replacements of existing documents are matched too, and the
+            # rest upserted
+            replaced = len([
+                i for i in batch if changes[i] is None and
+                i not in inserted and i not in failed
+            ])
+            matched = 0 if result is None else \
+                result.get('nMatched', 0) + result.get('nUpserted', 0)
+            if result is not None and matched < len(updated) + replaced:
+                # As in save(), updates to deleted documents are errors; the
+                # count doesn't say which, so look for the ones still there
+                found = set(d['_id'] for d in cls.__coll__.find(
+                    {'_id': {'$in': [docs[i]._id for i in updated]}},
+                    fields={'_id': 1}, as_class=dict))
+                for i in updated:
+                    if docs[i]._id not in found:
+                        errors[i] = ValueError('document no longer exists')
+                        failed.add(i)
 
-    def validate_fields_extra(self, spec):
-        self.__class__.__field_verify(spec, self)
+            for i in batch:
+                doc = docs[i]
+                if i in failed:
+                    if i in inserted:
+                        del doc['_id']
+                    continue
+                ids[i] = doc._id
+                doc.__saved(changes[i])
+                doc.post_save()
 
-    def validate_fields(self):
-        if '__fields__' in self.__class__.__dict__:
-            self.__class__.__field_verify(
-                self.__class__.__fields__,
-                self
+            if ordered and failed:
+                break
+
+        if listeners:
+            cls.__emit(listeners, 'save_many', timer() - began, {
+                'validate': validated - began,
+                'write': timer() - validated
+            }, count=len(docs), errors=len(errors))
+        return ids, errors
+
+    @_hybridmethod
+    def inc(cls, doc, *args, **kwargs):
+        '''
+        Atomically add n (default 1) to a field, or to several fields given
+        a dict of field to amount: doc.inc('views') or
+        cls.inc(spec_or_id, 'views', 5).
+        '''
+        return cls.__modify(doc, '$inc', _inc_args, args, kwargs)
+
+    @_hybridmethod
+    def push(cls, doc, *args, **kwargs):
+        '''
+        Atomically append a value to an array field: doc.push('tags', 'a')
+        or cls.push(spec_or_id, 'tags', 'a').
+        '''
+        return cls.__modify(doc, '$push', _array_args, args, kwargs)
+
+    @_hybridmethod
+    def pull(cls, doc, *args, **kwargs):
+        '''
+        Atomically remove every instance of a value from an array field:
+        doc.pull('tags', 'a') or cls.pull(spec_or_id, 'tags', 'a').
+        '''
+        return cls.__modify(doc, '$pull', _array_args, args, kwargs)
+
+    @_hybridmethod
+    def set_fields(cls, doc, *args, **kwargs):
+        '''
+        Atomically set fields, given as a dict and/or keyword arguments,
+        without writing the rest of the document: doc.set_fields(name='x')
+        or cls.set_fields(spec_or_id, {'nested.key': 1}).
+        '''
+        return cls.__modify(doc, '$set', _set_args, args, kwargs)
+
+    @classmethod
+    def __modify(cls, doc, op, parse, args, kwargs):
+        # Field names may be dotted, and camelCased as load_dict accepts
+        fetch = kwargs.pop('fetch', doc is not None)
+        multi = kwargs.pop('multi', False)
+        if doc is None:
+            spec, args = args[0], args[1:]
+        fields = parse(*args, **kwargs)
+        update = {op: dict(
+            (cls.__stored_path(k), v) for k, v in fields.items()
+        )}
+
+        listeners = cls.__listeners()
+        start = timer()
+        if doc is None:
+            rv = cls.__modify_matching(spec, update, multi, fetch)
+        else:
+            rv = doc.__modify_one(op, update, fetch)
+        if listeners:
+            duration = timer() - start
+            cls.__emit(listeners, 'update', duration, {
+                'write': duration
+            }, fields=sorted(update[op]))
+        return rv
+
+    def __modify_one(self, op, update, fetch):
+        '''
+        Update the stored document, then bring the updated fields of this
+        one (and its snapshot) in line: from the server's copy with fetch,
+        or by applying the update locally.
+        '''
+        if '_id' not in self:
+            raise ValueError('only saved documents can be updated in place')
+
+        paths = update[op]
+        if fetch:
+            stored = self.__coll__.find_and_modify(
+                {'_id': self._id}, update, new=True,
+                fields=dict((p, 1) for p in paths))
+            if stored is None:
+                raise ValueError('document no longer exists')
+            values = dict(
+                (p, _get_path(p.split('.'), stored)) for p in paths)
+        else:
+            rv = self.__coll__.update({'_id': self._id}, update)
+            if rv is not None and not rv.get('n'):
+                raise ValueError('document no longer exists')
+            values = dict(
+                (p, _apply_locally(op, _get_path(p.split('.'), self), v))
+                for p, v in paths.items()
             )
 
-    def save(self):
-        self.pre_save()
-        self.validate_fields()
-        self.validate()
-        self._id = self.__coll__.save(self)
-        self.post_save()
+        for path, value in values.items():
+            keys = path.split('.')
+            _set_path(keys, self, value)
+            if self.__snapshot__ is not None:
+                self.__snapshot__ = _replace_path(
+                    keys, self.__snapshot__, _snapshot(value))
+        self.__uncache()
+        return self
+
+    @classmethod
+    def __modify_matching(cls, spec, update, multi, fetch):
+        '''
+        Update the first (or with multi, every) document matching spec. With
+        fetch, returns the updated document, or None if nothing matched.
+        '''
+        if not isinstance(spec, dict):
+            spec = {'_id': spec}
+
+        rv = None
+        if fetch:
+            stored = cls.__coll__.find_and_modify(spec, update, new=True)
+            if stored is not None:
+                rv = cls.__load(stored, lookup=False)
+        else:
+            cls.__coll__.update(spec, update, multi=multi)
+
+        if cls.__query_cache__ is not None:
+            cls.__query_cache__.discard_if(lambda key, d: True)
+        return rv
 
     def delete(self):
-        self.__coll__.remove(self._id)
+        listeners = self.__listeners()
+        start = timer()
+        # A compound _id would be taken for a query
+        self.__coll__.remove({'_id': self._id})
+        written = timer()
+        self.__snapshot__ = None
+        identity_map = self.__identity_map()
+        key = _identity_key(self.__class__, self._id)
+        if identity_map is not None and key is not None:
+            identity_map.pop(key)
+        self.__uncache()
+        if listeners:
+            self.__emit(listeners, 'delete', timer() - start, {
+                'write': written - start
+            })
+
+    @classmethod
+    def pipeline(cls, allow_disk_use=False, batch_size=100, raw=False):
+        '''
+        Start building an aggregation pipeline over this class's collection.
+        See mongorm.pipeline.Pipeline.
+        '''
+        return cls.__pipeline__(cls, cls.__stored_path, cls.__aggregate,
+                                allow_disk_use, batch_size, raw)
+
+    @classmethod
+    def __aggregate(cls, stages, allow_disk_use, batch_size, raw, prefetch):
+        kwargs = {'cursor': {'batchSize': batch_size}}
+        if allow_disk_use:
+            kwargs['allowDiskUse'] = True
+        cursor = cls.__coll__.aggregate(stages, **kwargs)
+        if isinstance(cursor, dict):
+            # Servers without aggregation cursors return the whole result
+            cursor = iter(cursor['result'])
+
+        wrap = None if raw else cls.from_raw
+        listeners = cls.__listeners()
+        if not listeners:
+            return Cursor(cursor, wrap, None, cls, prefetch, batch_size)
+
+        def done(stats):
+            cls.__emit(
+                listeners, 'aggregate', stats['query'] + stats['load'],
+                {'query': stats['query'], 'load': stats['load']},
+                size=stats['size'], count=stats['count'],
+                stages=len(stages)
+            )
+
+        return Cursor(cursor, wrap, done, cls, prefetch, batch_size)
+
+    @classmethod
+    def find_columns(cls, spec, fields, **kwargs):
+        '''
+        Read the given (dotted) fields from every document matching spec
+        into columns, without building a document per row. Returns an
+        OrderedDict of field name to column: a numpy array when numpy is
+        installed (numeric for fields declared int, float or bool in
+        __fields__ whose values all have that type, object otherwise), or a
+        list. Fields missing from a
+        document read as None (NaN in float columns). Other keyword
+        arguments go to find, e.g. sort or limit.
+        '''
+        listeners = cls.__listeners()
+        start = timer()
+
+        paths = [cls.__stored_path(f) for f in fields]
+        projection = dict((p, 1) for p in paths)
+        if '_id' not in projection:
+            projection['_id'] = 0
+
+        getters = [functools.partial(_get_path, p.split('.')) for p in paths]
+
+        columns = [[] for _ in paths]
+        cursor = cls.__coll__.find(
+            spec, fields=projection, as_class=dict, **kwargs)
+        for d in cursor:
+            for column, get in zip(columns, getters):
+                column.append(get(d))
+        fetched = timer()
+
+        if numpy is not None:
+            declared = getattr(cls, '__fields__', None)
+            columns = [
+                _column(column, _spec_type(declared, path))
+                for column, path in zip(columns, paths)
+            ]
+
+        if listeners:
+            cls.__emit(listeners, 'find_columns', timer() - start, {
+                'fetch': fetched - start,
+                'convert': timer() - fetched
+            }, count=len(columns[0]) if columns else 0)
+
+        return OrderedDict(zip(fields, columns))
+
+    @classmethod
+    def parallel_scan(cls, spec=None, workers=4, fn=None, reduce=None,
+                      initial=None, raw=False, **kwargs):
+        '''
+        Scan the documents matching spec with a cursor per worker thread,
+        each over its own range of _ids. Returns an iterator over fn(doc)
+        for every document, in no particular order, or with reduce, the
+        result of folding them together with reduce(acc, result) starting
+        from initial (or the first result).
+
+        Documents are loaded as find would load them (raw=True gives plain
+        dicts), and other keyword arguments are passed on to find. An
+        exception in fn stops the scan and is raised to the caller. _ids of
+        mixed types are scanned with a single cursor.
+        '''
+        results = cls.__parallel_scan(spec or {}, workers, fn, raw, kwargs)
+        if reduce is None:
+            return results
+        if initial is None:
+            return functools.reduce(reduce, results)
+        return functools.reduce(reduce, results, initial)
+
+    @classmethod
+    def __id_ranges(cls, spec, workers):
+        '''
+        Split the _ids matching spec into up to workers ranges of roughly
+        equal size, as (lower, upper) bounds with None for unbounded.
+
+        Range queries only match values of the bound's type, so if the _ids
+        are of more than one type (say ints and ObjectIds), there's just
+        the one unbounded range.
+        '''
+        ends = [
+            list(cls.__coll__.find(spec, fields={'_id': 1}, as_class=dict)
+                 .sort('_id', direction).limit(1))
+            for direction in (1, -1)
+        ]
+        if not ends[0] or \
+                _range_type(ends[0][0]['_id']) != \
+                _range_type(ends[1][0]['_id']):
+            return [(None, None)]
+
+        n = cls.__coll__.find(spec).count()
+        bounds = [None]
+        for i in range(1, workers):
+            rv = list(
+                cls.__coll__.find(spec, fields={'_id': 1}, as_class=dict)
+                .sort('_id', 1).skip(i * n // workers).limit(1)
+            )
+            if rv and rv[0]['_id'] != bounds[-1]:
+                bounds.append(rv[0]['_id'])
+        bounds.append(None)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @classmethod
+    def __parallel_scan(cls, spec, workers, fn, raw, kwargs):
+        def scan(lower, upper, put):
+            bounds = {}
+            if lower is not None:
+                bounds['$gte'] = lower
+            if upper is not None:
+                bounds['$lt'] = upper
+            query = spec
+            if bounds:
+                query = {'$and': [spec, {'_id': bounds}]} if spec else \
+                    {'_id': bounds}
+            for doc in Document.find.__func__(cls, query, raw=raw, **kwargs):
+                if not put(fn(doc) if fn is not None else doc):
+                    return
+
+        return iter_threaded([
+            functools.partial(scan, lower, upper)
+            for lower, upper in cls.__id_ranges(spec, workers)
+        ], workers * 100)
+
+    @classmethod
+    def paginate(cls, spec=None, sort='_id', limit=20, token=None,
+                 count=False, **kwargs):
+        '''
+        One page of up to limit documents matching spec, ordered by sort (a
+        field name, or a (name, direction) pair) with ties broken by _id.
+        Returns a Page of the documents, the token for the next page (None
+        if this is the last one), and with count=True, the number of
+        documents matching spec, cached for __count_ttl__ seconds.
+
+        Rather than skipping over earlier pages, each page picks up where
+        the one before it ended, so deep pages cost no more than the first
+        as long as the sort field is indexed (with _id, unless it's _id).
+        Other keyword arguments are passed on to find.
+        '''
+        direction = 1
+        if isinstance(sort, (list, tuple)):
+            sort, direction = sort
+        key = cls.__stored_path(sort)
+        spec = spec or {}
+
+        query = spec
+        if token is not None:
+            after = _page_after(key, direction, token)
+            query = {'$and': [spec, after]} if spec else after
+
+        order = [(key, direction)]
+        if key != '_id':
+            order.append(('_id', direction))
+            if kwargs.get('only') is not None:
+                kwargs['only'] = list(kwargs['only']) + [sort]
+
+        docs = list(Document.find.__func__(
+            cls, query, sort=order, limit=limit + 1, **kwargs))
+        next_token = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_token = _page_token(key, direction, docs[-1])
+
+        total = cls.__count(spec) if count else None
+        return Page(docs, next_token, total)
+
+    @classmethod
+    def __count(cls, spec):
+        cache_key = json_util.dumps(spec, sort_keys=True)
+        rv = cls.__counts__.get(cache_key)
+        if rv is None:
+            rv = cls.__coll__.find(spec).count()
+            cls.__counts__.set(cache_key, rv)
+        return rv
+
+    @classmethod
+    def from_raw(cls, d, partial=None):
+        '''
+        Build a document from a dict as stored in the collection, e.g. one
+        returned by find(raw=True). Unlike load_dict, keys are taken as-is.
+        If d came from a projection, partial is the set of top-level keys
+        it holds in full.
+        '''
+        rv = cls()
+        rv.update(d)
+        if cls.__track_changes__:
+            # Lazy documents hold on to d's nested dicts and lists
+            lazy = isinstance(rv, LazyDotDict)
+            rv.__snapshot__ = _snapshot(d) if lazy else d
+        if partial is not None:
+            rv.__partial__ = partial
+        return rv
+
+    @classmethod
+    def __stored_path(cls, path):
+        '''
+        Map a dotted field path onto the keys documents are stored with,
+        accepting camelCased names as load_dict would.
+        '''
+        return '.'.join(
+            p if p[:1] == '$' or p.isdigit() else cls.__underscore_key__(p)
+            for p in path.split('.')
+        )
+
+    @classmethod
+    def __projection(cls, only):
+        fields = {}
+        loaded = set(['_id'])
+        for name in only:
+            path = cls.__stored_path(name)
+            fields[path] = 1
+            if '.' not in path:
+                loaded.add(path)
+        return fields, frozenset(loaded)
+
+    @classmethod
+    def __listeners(cls):
+        if cls.__database__ is None:
+            return None
+        return cls.__database__.__listeners__
+
+    @classmethod
+    def __emit(cls, listeners, op, duration, phases, **kwargs):
+        event = DotDict(
+            op=op,
+            collection=cls.__collection__,
+            document=cls.__name__,
+            duration=duration,
+            phases=phases
+        )
+        event.update(kwargs)
+        for listener in listeners:
+            listener(event)
+
+    @classmethod
+    def __compact(cls, kwargs):
+        if cls.__record__ is None:
+            raise TypeError(
+                '%s is not declared with __compact__' % cls.__name__)
+        # Undeclared fields wouldn't make it into the record anyway
+        if 'fields' not in kwargs:
+            kwargs['fields'] = dict(
+                (k, 1) for k in cls.__record__.__slots__)
+        return cls.__record__
+
+    @classmethod
+    def __identity_map(cls):
+        if cls.__database__ is None:
+            return None
+        return cls.__database__.identity_map
+
+    @classmethod
+    def __load(cls, d, lookup=True):
+        identity_map = cls.__identity_map()
+        key = None if '_id' not in d else _identity_key(cls, d['_id'])
+        if identity_map is None or key is None:
+            return cls.from_raw(d)
+
+        rv = identity_map.get(key) if lookup else None
+        if rv is None:
+            rv = cls.from_raw(d)
+            identity_map.set(key, rv)
+        return rv
 
     @classmethod
     def find(cls, *args, **kwargs):
-        return cls.__coll__.find(*args, as_class=cls, **kwargs)
+        raw = kwargs.pop('raw', False)
+        only = kwargs.pop('only', None)
+        compact = kwargs.pop('compact', False)
+        prefetch = kwargs.pop('prefetch', 0)
+        batch_size = kwargs.pop('batch_size', None)
+        wrap = None if raw else cls.__load
+        if only is not None:
+            kwargs['fields'], loaded = cls.__projection(only)
+            if not raw:
+                wrap = functools.partial(cls.from_raw, partial=loaded)
+        if compact:
+            record = cls.__compact(kwargs)
+            if not raw:
+                wrap = _loader(record)
+        cursor = cls.__coll__.find(*args, as_class=dict, **kwargs)
+        if batch_size is not None:
+            cursor.batch_size(batch_size)
+        else:
+            batch_size = 100
+        listeners = cls.__listeners()
+        if not listeners:
+            return Cursor(cursor, wrap, None, cls, prefetch, batch_size)
+
+        def done(stats):
+            cls.__emit(
+                listeners, 'find', stats['query'] + stats['load'],
+                {'query': stats['query'], 'load': stats['load']},
+                size=stats['size'], count=stats['count']
+            )
+
+        return Cursor(cursor, wrap, done, cls, prefetch, batch_size)
 
     @classmethod
     def find_one(cls, *args, **kwargs):
-        return cls.__coll__.find_one(*args, as_class=cls, **kwargs)
+        listeners = cls.__listeners()
+        if not listeners:
+            return cls.__find_one(None, args, kwargs)
+
+        phases = {}
+        start = timer()
+        rv = cls.__find_one(phases, args, kwargs)
+        duration = timer() - start
+        # Anything that didn't go to the server was answered from memory
+        if 'query' in phases:
+            phases['load'] = duration - phases['query']
+        else:
+            phases['cache'] = duration
+        if isinstance(rv, Record):
+            size = len(BSON.encode(Record.to_dict(rv)))
+        else:
+            size = 0 if rv is None else len(BSON.encode(rv))
+        cls.__emit(listeners, 'find_one', duration, phases, size=size)
+        return rv
+
+    @classmethod
+    def __fetch_one(cls, phases, args, kwargs):
+        start = timer()
+        rv = cls.__coll__.find_one(*args, as_class=dict, **kwargs)
+        if phases is not None:
+            phases['query'] = timer() - start
+        return rv
+
+    @classmethod
+    def __find_one(cls, phases, args, kwargs):
+        raw = kwargs.pop('raw', False)
+        only = kwargs.pop('only', None)
+        compact = kwargs.pop('compact', False)
+        if only is not None or compact:
+            loaded = None
+            if only is not None:
+                kwargs['fields'], loaded = cls.__projection(only)
+            if compact:
+                wrap = _loader(cls.__compact(kwargs))
+            else:
+                wrap = functools.partial(cls.from_raw, partial=loaded)
+            rv = cls.__fetch_one(phases, args, kwargs)
+            if rv is None or raw:
+                return rv
+            return wrap(rv)
+
+        # Lookups by _id alone can be answered from the identity map
+        identity_map = None if raw else cls.__identity_map()
+        looked_up = False
+        if identity_map is not None and len(args) == 1 and not kwargs:
+            spec = args[0]
+            if isinstance(spec, dict):
+                _id = spec.get('_id') if len(spec) == 1 else None
+            else:
+                _id = spec
+            key = None if _id is None else _identity_key(cls, _id)
+            if key is not None:
+                rv = identity_map.get(key)
+                if rv is not None:
+                    return rv
+                looked_up = True
+
+        # Then equality lookups from the class's query cache
+        query_cache = None if raw else cls.__query_cache__
+        cache_key = None
+        if query_cache is not None and len(args) == 1 and not kwargs:
+            cache_key = _cache_key(args[0])
+            if cache_key is not None:
+                cache_key = (cls, cache_key)
+                rv = query_cache.get(cache_key)
+                if rv is not None:
+                    # Each document gets its own copy to snapshot
+                    return cls.__load(_snapshot(rv), lookup=not looked_up)
+
+        rv = cls.__fetch_one(phases, args, kwargs)
+        if rv is None or raw:
+            return rv
+        if cache_key is not None:
+            query_cache.set(cache_key, _snapshot(rv))
+        return cls.__load(rv, lookup=not looked_up)
@@ -0,0 +1,1493 @@
+'''
+An in-process stand-in for a MongoDB server, for tests and benchmarks that
+shouldn't need a running mongod. Use it with Database(backend='memory').
+
+MemoryClient mimics the parts of pymongo's MongoClient, Database,
+Collection and Cursor that mongorm uses: saves, inserts, updates and
+removes with the common update operators, queries with the common query
+operators (including dotted paths and arrays), projections, sorting,
+indexes (unique ones are enforced, and single-field ones answer equality
+queries), bulk operations, find_and_modify and a subset of the aggregation
+pipeline. Anything else raises NotImplementedError or OperationFailure.
+
+Clients share their data by host and port, as they would a server, for as
+long as the process runs. Documents are copied going in and out, so
+nothing outside the backend holds on to what it stores.
+'''
+
+from bson import ObjectId
+from collections import OrderedDict
+from pymongo import uri_parser
+from pymongo.errors import (
+    BulkWriteError,
+    ConfigurationError,
+    DuplicateKeyError,
+    InvalidOperation,
+    OperationFailure
+)
+import datetime
+import itertools
+import numbers
+import re
+import threading
+
+try:
+    string_types = (str, unicode)
+except NameError:
+    string_types = (str, )
+
+try:
+    RegexType = re.Pattern
+except AttributeError:
+    RegexType = type(re.compile(''))
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def _copy(value, as_class=dict):
+    '''
+    Deep copy a document, turning every embedded document into as_class.
+    '''
+    if isinstance(value, dict):
+        rv = as_class()
+        for k, v in value.items():
+            rv[k] = _copy(v, as_class)
+        return rv
+    elif isinstance(value, (list, tuple)):
+        return [_copy(v, as_class) for v in value]
+    return value
+
+
+def _rank(value):
+    '''
+    Where a value's type falls in MongoDB's comparison order.
+    '''
+    if value is None:
+        return 1
+    elif isinstance(value, bool):
+        return 8
+    elif isinstance(value, numbers.Number):
+        return 2
+    elif isinstance(value, string_types):
+        return 3
+    elif isinstance(value, dict):
+        return 4
+    elif isinstance(value, list):
+        return 5
+    elif isinstance(value, bytes):
+        return 6
+    elif isinstance(value, ObjectId):
+        return 7
+    elif isinstance(value, datetime.datetime):
+        return 9
+    return 10
+
+
+def _sort_key(value):
+    rank = _rank(value)
+    if rank == 1:
+        return (rank, 0)
+    elif rank == 4:
+        return (rank, tuple((k, _sort_key(v)) for k, v in value.items()))
+    elif rank == 5:
+        return (rank, tuple(_sort_key(v) for v in value))
+    return (rank, value)
+
+
+def _hashable(value):
+    '''
+    A hashable stand-in for a value, equal for values the server considers
+    equal (1 and 1.0, but not 1 and True).
+    '''
+    if isinstance(value, dict):
+        return (4, tuple((k, _hashable(v)) for k, v in value.items()))
+    elif isinstance(value, list):
+        return (5, tuple(_hashable(v) for v in value))
+    return (_rank(value), value)
+
+
+def _eq(a, b):
+    return _rank(a) == _rank(b) and a == b
+
+
+def _values(value, keys):
+    '''
+    Every value found at a path (as a list of keys), descending into arrays
+    the way queries do.
+    '''
+    if not keys:
+        return [value]
+    k, rest = keys[0], keys[1:]
+    if isinstance(value, dict):
+        if k in value:
+            return _values(value[k], rest)
+        return []
+    elif isinstance(value, list):
+        rv = []
+        if k.isdigit() and int(k) < len(value):
+            rv.extend(_values(value[int(k)], rest))
+        for v in value:
+            if isinstance(v, dict):
+                rv.extend(_values(v, keys))
+        return rv
+    return []
+
+
+def _get(value, path):
+    '''
+    The value at a dotted path as an expression would see it: None if
+    missing, and a list of values for a path through an array.
+    '''
+    for k in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(k)
+        elif isinstance(value, list):
+            value = [v.get(k) for v in value if isinstance(v, dict) and k in v]
+        else:
+            return None
+    return value
+
+
+def _expand(values):
+    for v in values:
+        yield v
+        if isinstance(v, list):
+            for item in v:
+                yield item
+
+
+def _is_operator(cond):
+    return isinstance(cond, dict) and len(cond) > 0 and \
+        all(isinstance(k, string_types) and k[:1] == '$' for k in cond)
+
+
+def _is_bson_regex(value):
+    # Dicts never are, and hasattr would let a DotDict's KeyError through
+    return not isinstance(value, dict) and hasattr(value, 'try_compile')
+
+
+def _regex(pattern, options=''):
+    if isinstance(pattern, RegexType):
+        return pattern
+    if hasattr(pattern, 'try_compile'):
+        # bson.regex.Regex
+        return pattern.try_compile()
+    flags = 0
+    for o in options or '':
+        flags |= {
+            'i': re.I, 'm': re.M, 's': re.S, 'x': re.X
+        }.get(o, 0)
+    return re.compile(pattern, flags)
+
+
+def _equals(values, target):
+    if isinstance(target, RegexType) or _is_bson_regex(target):
+        regex = _regex(target)
+        return any(
+            isinstance(v, string_types) and regex.search(v)
+            for v in _expand(values)
+        )
+    if target is None and not values:
+        return True
+    return any(_eq(v, target) for v in _expand(values))
+
+
+def _compare(values, target, op):
+    rank = _rank(target)
+    key = _sort_key(target)
+    for v in _expand(values):
+        if _rank(v) == rank and op(_sort_key(v), key):
+            return True
+    return False
+
+
+def _match_operators(values, cond):
+    for op, arg in cond.items():
+        if op == '$eq':
+            ok = _equals(values, arg)
+        elif op == '$ne':
+            ok = not _equals(values, arg)
+        elif op == '$gt':
+            ok = _compare(values, arg, lambda a, b: a > b)
+        elif op == '$gte':
+            ok = _compare(values, arg, lambda a, b: a >= b)
+        elif op == '$lt':
+            ok = _compare(values, arg, lambda a, b: a < b)
+        elif op == '$lte':
+            ok = _compare(values, arg, lambda a, b: a <= b)
+        elif op == '$in':
+            ok = any(_equals(values, a) for a in arg)
+        elif op == '$nin':
+            ok = not any(_equals(values, a) for a in arg)
+        elif op == '$exists':
+            ok = bool(values) == bool(arg)
+        elif op == '$regex':
+            regex = _regex(arg, cond.get('$options'))
+            ok = any(
+                isinstance(v, string_types) and regex.search(v)
+                for v in _expand(values)
+            )
+        elif op == '$options':
+            continue
+        elif op == '$size':
+            ok = any(isinstance(v, list) and len(v) == arg for v in values)
+        elif op == '$all':
+            ok = bool(arg) and all(_equals(values, a) for a in arg)
+        elif op == '$elemMatch':
+            ok = any(
+                isinstance(v, list) and any(_match_element(e, arg) for e in v)
+                for v in values
+            )
+        elif op == '$not':
+            ok = not _match_condition(values, arg)
+        elif op == '$mod':
+            divisor, remainder = arg
+            ok = any(
+                isinstance(v, numbers.Number) and not isinstance(v, bool) and
+                v % divisor == remainder
+                for v in _expand(values)
+            )
+        else:
+            raise OperationFailure('unsupported query operator: %s' % op)
+        if not ok:
+            return False
+    return True
+
+
+def _match_element(element, cond):
+    if _is_operator(cond):
+        return _match_operators([element], cond)
+    return isinstance(element, dict) and _match(element, cond)
+
+
+def _match_condition(values, cond):
+    if isinstance(cond, RegexType):
+        return _equals(values, cond)
+    if _is_operator(cond):
+        return _match_operators(values, cond)
+    return _equals(values, cond)
+
+
+def _match(doc, spec):
+    '''
+    Whether a document matches a query.
+    '''
+    for k, cond in spec.items():
+        if k == '$and':
+            if not all(_match(doc, s) for s in cond):
+                return False
+        elif k == '$or':
+            if not any(_match(doc, s) for s in cond):
+                return False
+        elif k == '$nor':
+            if any(_match(doc, s) for s in cond):
+                return False
+        elif k[:1] == '$':
+            raise NotImplementedError(
+                '%s is not supported by the memory backend' % k)
+        elif not _match_condition(_values(doc, k.split('.')), cond):
+            return False
+    return True
+
+
+def _field_tree(fields):
+    tree = {}
+    for path in fields:
+        node = tree
+        keys = path.split('.')
+        for k in keys[:-1]:
+            sub = node.get(k)
+            if sub is True:
+                break
+            node = node.setdefault(k, {})
+        else:
+            node[keys[-1]] = True
+    return tree
+
+
+def _include(value, tree):
+    if isinstance(value, list):
+        return [_include(v, tree) for v in value if isinstance(v, dict)]
+    rv = {}
+    for k, sub in tree.items():
+        if k not in value:
+            continue
+        if sub is True:
+            rv[k] = value[k]
+        elif isinstance(value[k], (dict, list)):
+            rv[k] = _include(value[k], sub)
+    return rv
+
+
+def _exclude(value, tree):
+    if isinstance(value, list):
+        return [
+            _exclude(v, tree) if isinstance(v, dict) else v for v in value
+        ]
+    rv = dict(value)
+    for k, sub in tree.items():
+        if k not in rv:
+            continue
+        if sub is True:
+            del rv[k]
+        elif isinstance(rv[k], (dict, list)):
+            rv[k] = _exclude(rv[k], sub)
+    return rv
+
+
+def _projector(fields):
+    '''
+    Turn a find fields argument (a list of names, or a dict of name to
+    0/1) into a function applying it to a document.
+    '''
+    if fields is None:
+        return None
+    if not isinstance(fields, dict):
+        fields = dict((f, 1) for f in fields)
+    fields = dict(fields)
+    include_id = fields.pop('_id', 1)
+    if any(isinstance(v, dict) for v in fields.values()):
+        raise NotImplementedError(
+            'projection operators are not supported by the memory backend')
+
+    included = [k for k, v in fields.items() if v]
+    excluded = [k for k, v in fields.items() if not v]
+    if included and excluded:
+        raise OperationFailure('cannot mix inclusion and exclusion')
+
+    if included or not excluded:
+        tree = _field_tree(included)
+
+        def project(doc):
+            rv = _include(doc, tree)
+            if include_id and '_id' in doc:
+                rv['_id'] = doc['_id']
+            return rv
+    else:
+        tree = _field_tree(excluded)
+
+        def project(doc):
+            rv = _exclude(doc, tree)
+            if not include_id:
+                rv.pop('_id', None)
+            return rv
+
+    return project
+
+
+def _sort_spec(key_or_list, direction=None):
+    if isinstance(key_or_list, string_types):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+def _sort(docs, spec):
+    # Stable sorts, least significant key first
+    for key, direction in reversed(spec):
+        keys = key.split('.')
+
+        def sort_key(doc, keys=keys, direction=direction):
+            values = _values(doc, keys)
+            if not values:
+                return _sort_key(None)
+            expanded = [
+                _sort_key(v) for v in _expand(values)
+                if not isinstance(v, list)
+            ] or [_sort_key(values[0])]
+            return min(expanded) if direction > 0 else max(expanded)
+
+        docs.sort(key=sort_key, reverse=direction < 0)
+    return docs
+
+
+def _container(doc, path, create=True):
+    '''
+    The container holding the last key of a dotted path, and that key,
+    creating embedded documents on the way if asked to.
+    '''
+    keys = path.split('.')
+    if '$' in keys:
+        raise NotImplementedError(
+            'the positional operator is not supported by the memory backend')
+    node = doc
+    for k in keys[:-1]:
+        if isinstance(node, list):
+            if not k.isdigit():
+                raise OperationFailure('cannot traverse array at %s' % path)
+            i = int(k)
+            while len(node) <= i:
+                if not create:
+                    return None, None
+                node.append(None)
+            if node[i] is None:
+                node[i] = {}
+            node = node[i]
+        elif isinstance(node, dict):
+            if k not in node:
+                if not create:
+                    return None, None
+                node[k] = {}
+            node = node[k]
+        else:
+            raise OperationFailure('cannot traverse %s' % path)
+        if not isinstance(node, (dict, list)):
+            raise OperationFailure('cannot traverse %s' % path)
+
+    k = keys[-1]
+    if isinstance(node, list):
+        if not k.isdigit():
+            raise OperationFailure('cannot traverse array at %s' % path)
+        k = int(k)
+        if create:
+            while len(node) <= k:
+                node.append(None)
+    return node, k
+
+
+def _has(node, k):
+    if isinstance(node, list):
+        return k < len(node)
+    return node is not None and k in node
+
+
+def _number(value, path):
+    if not isinstance(value, numbers.Number) or isinstance(value, bool):
+        raise OperationFailure('%s is not a number' % path)
+    return value
+
+
+def _array(node, k, path):
+    if not _has(node, k):
+        node[k] = []
+    if not isinstance(node[k], list):
+        raise OperationFailure('%s is not an array' % path)
+    return node[k]
+
+
+def _pull_matches(element, cond):
+    if isinstance(cond, dict):
+        if _is_operator(cond):
+            return _match_operators([element], cond)
+        return isinstance(element, dict) and _match(element, cond)
+    return _eq(element, cond)
+
+
+def _apply_update(doc, update, inserting=False):
+    '''
+    Apply an update document to (a copy of) doc and return the result.
+    '''
+    if not any(k[:1] == '$' for k in update):
+        rv = _copy(update)
+        if '_id' in rv and '_id' in doc and not _eq(rv['_id'], doc['_id']):
+            raise OperationFailure('the _id field cannot be changed')
+        if '_id' in doc:
+            rv['_id'] = doc['_id']
+        return rv
+
+    rv = _copy(doc)
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            if op == '$setOnInsert':
+                if not inserting:
+                    continue
+                op_ = '$set'
+            else:
+                op_ = op
+            if path == '_id' and op_ != '$set':
+                raise OperationFailure('the _id field cannot be changed')
+
+            if op_ == '$unset':
+                node, k = _container(rv, path, create=False)
+                if _has(node, k):
+                    if isinstance(node, list):
+                        node[k] = None
+                    else:
+                        del node[k]
+                continue
+
+            if op_ == '$rename':
+                node, k = _container(rv, path, create=False)
+                if _has(node, k):
+                    value = node.pop(k)
+                    dest, dk = _container(rv, arg)
+                    dest[dk] = value
+                continue
+
+            node, k = _container(rv, path)
+            if op_ == '$set':
+                node[k] = _copy(arg)
+            elif op_ == '$inc':
+                current = node[k] if _has(node, k) else None
+                current = 0 if current is None else _number(current, path)
+                node[k] = current + _number(arg, path)
+            elif op_ == '$mul':
+                current = node[k] if _has(node, k) else None
+                current = 0 if current is None else _number(current, path)
+                node[k] = current * _number(arg, path)
+            elif op_ in ('$min', '$max'):
+                if not _has(node, k) or node[k] is None:
+                    node[k] = _copy(arg)
+                else:
+                    a, b = _sort_key(arg), _sort_key(node[k])
+                    if (a < b) if op_ == '$min' else (a > b):
+                        node[k] = _copy(arg)
+            elif op_ in ('$push', '$addToSet'):
+                lst = _array(node, k, path)
+                if isinstance(arg, dict) and '$each' in arg:
+                    items = arg['$each']
+                else:
+                    items = [arg]
+                for item in items:
+                    if op_ == '$addToSet' and \
+                            any(_eq(item, v) for v in lst):
+                        continue
+                    lst.append(_copy(item))
+                if op_ == '$push' and isinstance(arg, dict) and \
+                        '$slice' in arg:
+                    n = arg['$slice']
+                    lst[:] = lst[n:] if n < 0 else lst[:n]
+            elif op_ == '$pop':
+                lst = _array(node, k, path)
+                if lst:
+                    lst.pop(0 if arg < 0 else -1)
+            elif op_ == '$pull':
+                lst = _array(node, k, path)
+                lst[:] = [v for v in lst if not _pull_matches(v, arg)]
+            elif op_ == '$pullAll':
+                lst = _array(node, k, path)
+                lst[:] = [v for v in lst if not any(_eq(v, a) for a in arg)]
+            else:
+                raise OperationFailure('unsupported update operator: %s' % op)
+
+    if '_id' in doc and not _eq(rv.get('_id'), doc['_id']):
+        raise OperationFailure('the _id field cannot be changed')
+    return rv
+
+
+def _upsert_base(spec):
+    '''
+    The document an upsert starts from: the equality parts of its query.
+    '''
+    rv = {}
+    for k, v in spec.items():
+        if k == '$and':
+            for s in v:
+                base = _upsert_base(s)
+                for bk, bv in base.items():
+                    rv[bk] = bv
+        elif k[:1] == '$' or _is_operator(v) or isinstance(v, RegexType):
+            continue
+        else:
+            node, key = _container(rv, k)
+            node[key] = _copy(v)
+    return rv
+
+
+class _Index(object):
+
+    def __init__(self, name, keys, unique=False, sparse=False, **options):
+        self.name = name
+        self.keys = keys
+        self.unique = unique
+        self.sparse = sparse
+        self.options = options
+        self.entries = {}
+
+    def info(self):
+        rv = {'key': list(self.keys), 'v': 1}
+        if self.unique:
+            rv['unique'] = True
+        if self.sparse:
+            rv['sparse'] = True
+        rv.update(self.options)
+        return rv
+
+    def doc_keys(self, doc):
+        '''
+        The keys a document is indexed under, one per array element for
+        arrays (in each field), or none for sparse indexes missing a field.
+        '''
+        per_field = []
+        for field, _ in self.keys:
+            values = _values(doc, field.split('.'))
+            if not values:
+                if self.sparse:
+                    return []
+                values = [None]
+            expanded = []
+            for v in values:
+                if isinstance(v, list) and v:
+                    expanded.extend(v)
+                else:
+                    expanded.append(v)
+            per_field.append(set(_hashable(v) for v in expanded))
+        return set(itertools.product(*per_field))
+
+    def check(self, doc, _id):
+        if not self.unique:
+            return
+        for key in self.doc_keys(doc):
+            ids = self.entries.get(key)
+            if ids and (len(ids) > 1 or _id not in ids):
+                raise DuplicateKeyError(
+                    'E11000 duplicate key error index: %s dup key: %r' % (
+                        self.name, key), 11000)
+
+    def add(self, doc, _id):
+        for key in self.doc_keys(doc):
+            self.entries.setdefault(key, set()).add(_id)
+
+    def remove(self, doc, _id):
+        for key in self.doc_keys(doc):
+            ids = self.entries.get(key)
+            if ids is not None:
+                ids.discard(_id)
+                if not ids:
+                    del self.entries[key]
+
+
+def _index_name(keys):
+    return '_'.join('%s_%s' % (k, d) for k, d in keys)
+
+
+class MemoryCursor(object):
+
+    '''
+    A cursor over a MemoryCollection query. The query runs when the first
+    result is read, against a snapshot of the matching documents.
+    '''
+
+    def __init__(self, collection, spec=None, fields=None, skip=0, limit=0,
+                 sort=None, as_class=None, **kwargs):
+        self.collection = collection
+        self.__spec = spec or {}
+        self.__fields = fields
+        self.__skip = skip
+        self.__limit = limit
+        self.__sort = _sort_spec(sort) if sort else None
+        self.__as_class = as_class or dict
+        self.__results = None
+
+    def __check_unstarted(self):
+        if self.__results is not None:
+            raise InvalidOperation('cannot set options after executing query')
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.__results is None:
+            self.__results = iter(self.collection._query(
+                self.__spec, self.__fields, self.__skip, self.__limit,
+                self.__sort, self.__as_class))
+        return next(self.__results)
+
+    __next__ = next
+
+    def sort(self, key_or_list, direction=None):
+        self.__check_unstarted()
+        self.__sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self.__check_unstarted()
+        self.__skip = skip
+        return self
+
+    def limit(self, limit):
+        self.__check_unstarted()
+        self.__limit = limit
+        return self
+
+    def count(self, with_limit_and_skip=False):
+        if with_limit_and_skip:
+            return len(self.collection._query(
+                self.__spec, None, self.__skip, self.__limit, None, dict))
+        return self.collection._count(self.__spec)
+
+    def distinct(self, key):
+        return self.collection.distinct(key, self.__spec)
+
+    def rewind(self):
+        self.__results = None
+        return self
+
+    def clone(self):
+        return MemoryCursor(
+            self.collection, self.__spec, self.__fields, self.__skip,
+            self.__limit, self.__sort, self.__as_class)
+
+    def __getitem__(self, index):
+        self.__check_unstarted()
+        if isinstance(index, slice):
+            if index.step is not None:
+                raise IndexError('cursor slices cannot have a step')
+            start = index.start or 0
+            self.__skip = start
+            if index.stop is not None:
+                self.__limit = max(index.stop - start, 0) or -1
+            return self
+        clone = self.clone()
+        clone.__skip = self.__skip + index
+        clone.__limit = -1
+        for doc in clone:
+            return doc
+        raise IndexError('no such item for cursor instance')
+
+    def where(self, code):
+        raise NotImplementedError(
+            '$where is not supported by the memory backend')
+
+    def close(self):
+        self.__results = iter(())
+
+    @property
+    def alive(self):
+        return self.__results is None
+
+    def _noop(self, *args, **kwargs):
+        return self
+
+    add_option = batch_size = comment = hint = max = max_scan = \
+        max_time_ms = min = remove_option = _noop
+
+
+class _CommandCursor(object):
+
+    '''
+    What aggregate returns when asked for a cursor.
+    '''
+
+    def __init__(self, results):
+        self.__results = iter(results)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self.__results)
+
+    __next__ = next
+
+    def batch_size(self, batch_size):
+        return self
+
+    def close(self):
+        self.__results = iter(())
+
+
+class _BulkFind(object):
+
+    def __init__(self, bulk, selector, upsert=False):
+        self.__bulk = bulk
+        self.__selector = selector
+        self.__upsert = upsert
+
+    def upsert(self):
+        return _BulkFind(self.__bulk, self.__selector, True)
+
+    def update_one(self, update):
+        self.__bulk._add('update', self.__selector, update, self.__upsert,
+                         False)
+
+    def update(self, update):
+        self.__bulk._add('update', self.__selector, update, self.__upsert,
+                         True)
+
+    def replace_one(self, replacement):
+        self.__bulk._add('update', self.__selector, replacement,
+                         self.__upsert, False)
+
+    def remove_one(self):
+        self.__bulk._add('remove', self.__selector, False)
+
+    def remove(self):
+        self.__bulk._add('remove', self.__selector, True)
+
+
+class _BulkOperation(object):
+
+    '''
+    Collects writes and runs them in order on execute, as pymongo's
+    BulkOperationBuilder would.
+    '''
+
+    def __init__(self, collection, ordered):
+        self.__collection = collection
+        self.__ordered = ordered
+        self.__ops = []
+        self.__executed = False
+
+    def _add(self, *op):
+        self.__ops.append(op)
+
+    def find(self, selector):
+        return _BulkFind(self, selector)
+
+    def insert(self, document):
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        self._add('insert', document)
+
+    def execute(self, write_concern=None):
+        if self.__executed:
+            raise InvalidOperation('bulk operations can only be executed once')
+        if not self.__ops:
+            raise InvalidOperation('no operations to execute')
+        self.__executed = True
+
+        coll = self.__collection
+        result = {
+            'nInserted': 0,
+            'nUpserted': 0,
+            'nMatched': 0,
+            'nModified': 0,
+            'nRemoved': 0,
+            'upserted': [],
+            'writeErrors': [],
+            'writeConcernErrors': []
+        }
+        for i, op in enumerate(self.__ops):
+            try:
+                if op[0] == 'insert':
+                    coll.insert(op[1])
+                    result['nInserted'] += 1
+                elif op[0] == 'update':
+                    _, selector, update, upsert, multi = op
+                    rv = coll.update(selector, update, upsert, multi=multi)
+                    if 'upserted' in rv:
+                        result['nUpserted'] += 1
+                        result['upserted'].append(
+                            {'index': i, '_id': rv['upserted']})
+                    else:
+                        result['nMatched'] += rv['n']
+                        result['nModified'] += rv['nModified']
+                else:
+                    _, selector, multi = op
+                    result['nRemoved'] += coll.remove(
+                        selector, multi=multi)['n']
+            except OperationFailure as e:
+                result['writeErrors'].append({
+                    'index': i,
+                    'code': e.code,
+                    'errmsg': str(e),
+                    'op': op[1]
+                })
+                if self.__ordered:
+                    break
+
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return result
+
+
+class MemoryCollection(object):
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = '%s.%s' % (database.name, name)
+        self.read_preference = None
+        self.write_concern = {}
+        self._exists = False
+        self.__lock = threading.RLock()
+        self.__docs = OrderedDict()
+        # Where each document falls in __docs, to put index hits in order
+        self.__positions = {}
+        self.__next_position = itertools.count()
+        self.__indexes = OrderedDict()
+
+    def __repr__(self):
+        return 'MemoryCollection(%r)' % self.full_name
+
+    def __ensure_exists(self):
+        if not self._exists:
+            self._exists = True
+            self.database._created(self)
+
+    def _reset(self):
+        with self.__lock:
+            self._exists = False
+            self.__docs.clear()
+            self.__positions.clear()
+            self.__indexes.clear()
+
+    # Reads
+
+    def __candidates(self, spec):
+        '''
+        The documents that might match spec, narrowed down with the _id
+        index or a single-field index where the query allows.
+        '''
+        def scalar(v):
+            return not isinstance(v, (dict, list, RegexType)) and \
+                v is not None and not _is_bson_regex(v)
+
+        def lookup(v):
+            if scalar(v):
+                return [v]
+            if _is_operator(v) and len(v) == 1:
+                if '$eq' in v and scalar(v['$eq']):
+                    return [v['$eq']]
+                if '$in' in v and all(scalar(a) for a in v['$in']):
+                    return v['$in']
+            return None
+
+        if '_id' in spec:
+            ids = lookup(spec['_id'])
+            if ids is not None:
+                rv = []
+                for _id in ids:
+                    doc = self.__docs.get(_hashable(_id))
+                    if doc is not None:
+                        rv.append(doc)
+                return rv
+
+        for index in self.__indexes.values():
+            if len(index.keys) != 1 or index.sparse:
+                continue
+            field = index.keys[0][0]
+            if field not in spec:
+                continue
+            values = lookup(spec[field])
+            if values is None:
+                continue
+            ids = set()
+            for v in values:
+                ids.update(index.entries.get((_hashable(v), ), ()))
+            return [
+                self.__docs[h]
+                for h in sorted(ids, key=self.__positions.__getitem__)
+            ]
+
+        return list(self.__docs.values())
+
+    def _query(self, spec, fields=None, skip=0, limit=0, sort=None,
+               as_class=dict):
+        if not isinstance(spec, dict):
+            spec = {'_id': spec}
+        with self.__lock:
+            docs = [d for d in self.__candidates(spec) if _match(d, spec)]
+        if sort:
+            docs = _sort(docs, _sort_spec(sort))
+        if skip:
+            docs = docs[skip:]
+        if limit:
+            docs = docs[:abs(limit)]
+        project = _projector(fields)
+        if project is not None:
+            docs = [project(d) for d in docs]
+        return [_copy(d, as_class) for d in docs]
+
+    def _count(self, spec):
+        with self.__lock:
+            return len([d for d in self.__candidates(spec) if _match(d, spec)])
+
+    def find(self, *args, **kwargs):
+        return MemoryCursor(self, *args, **kwargs)
+
+    def find_one(self, spec_or_id=None, *args, **kwargs):
+        if spec_or_id is not None and not isinstance(spec_or_id, dict):
+            spec_or_id = {'_id': spec_or_id}
+        kwargs['limit'] = -1
+        for doc in self.find(spec_or_id, *args, **kwargs):
+            return doc
+        return None
+
+    def count(self):
+        return len(self.__docs)
+
+    def distinct(self, key, spec=None):
+        rv = []
+        seen = set()
+        for doc in self._query(spec or {}):
+            for v in _expand(_values(doc, key.split('.'))):
+                if isinstance(v, list):
+                    continue
+                h = _hashable(v)
+                if h not in seen:
+                    seen.add(h)
+                    rv.append(v)
+        return rv
+
+    # Writes
+
+    def __store(self, old, new):
+        '''
+        Put new in place of old (either may be None), keeping indexes up
+        to date. Raises DuplicateKeyError, leaving everything unchanged, if
+        new breaks a unique index.
+        '''
+        if new is not None:
+            h = _hashable(new['_id'])
+            existing = self.__docs.get(h)
+            if existing is not None and existing is not old:
+                raise DuplicateKeyError(
+                    'E11000 duplicate key error index: %s.$_id_ dup key: %r'
+                    % (self.full_name, new['_id']), 11000)
+            for index in self.__indexes.values():
+                index.check(new, h)
+
+        if old is not None:
+            h = _hashable(old['_id'])
+            for index in self.__indexes.values():
+                index.remove(old, h)
+            if new is None:
+                del self.__docs[h]
+                del self.__positions[h]
+
+        if new is not None:
+            h = _hashable(new['_id'])
+            for index in self.__indexes.values():
+                index.add(new, h)
+            if h not in self.__docs:
+                self.__positions[h] = next(self.__next_position)
+            self.__docs[h] = new
+            self.__ensure_exists()
+
+    def insert(self, doc_or_docs, manipulate=True, safe=None,
+               check_keys=True, continue_on_error=False, **kwargs):
+        docs = doc_or_docs
+        if isinstance(doc_or_docs, dict):
+            docs = [doc_or_docs]
+        ids = []
+        error = None
+        with self.__lock:
+            self.__ensure_exists()
+            for doc in docs:
+                if '_id' not in doc:
+                    doc['_id'] = ObjectId()
+                try:
+                    self.__store(None, _copy(doc))
+                except DuplicateKeyError as e:
+                    if not continue_on_error:
+                        raise
+                    error = e
+                ids.append(doc['_id'])
+        if error is not None:
+            raise error
+        return ids[0] if isinstance(doc_or_docs, dict) else ids
+
+    def save(self, to_save, manipulate=True, safe=None, check_keys=True,
+             **kwargs):
+        if '_id' not in to_save:
+            return self.insert(to_save)
+        self.update({'_id': to_save['_id']}, to_save, upsert=True)
+        return to_save['_id']
+
+    def update(self, spec, document, upsert=False, manipulate=False,
+               safe=None, multi=False, check_keys=True, **kwargs):
+        rv = {'ok': 1.0, 'err': None, 'n': 0, 'nModified': 0,
+              'updatedExisting': False}
+        with self.__lock:
+            matched = [d for d in self.__candidates(spec) if _match(d, spec)]
+            if not multi:
+                matched = matched[:1]
+
+            updated = [(d, _apply_update(d, document)) for d in matched]
+            for old, new in updated:
+                self.__store(old, new)
+                rv['n'] += 1
+                if old != new:
+                    rv['nModified'] += 1
+            rv['updatedExisting'] = bool(updated)
+
+            if not updated and upsert:
+                new = _apply_update(_upsert_base(spec), document, True)
+                if '_id' not in new:
+                    base = _upsert_base(spec)
+                    new['_id'] = base['_id'] if '_id' in base else ObjectId()
+                self.__store(None, new)
+                rv['n'] = 1
+                rv['upserted'] = new['_id']
+
+        return rv
+
+    def remove(self, spec_or_id=None, safe=None, multi=True, **kwargs):
+        if spec_or_id is None:
+            spec_or_id = {}
+        if not isinstance(spec_or_id, dict):
+            spec_or_id = {'_id': spec_or_id}
+        with self.__lock:
+            matched = [
+                d for d in self.__candidates(spec_or_id)
+                if _match(d, spec_or_id)
+            ]
+            if not multi:
+                matched = matched[:1]
+            for doc in matched:
+                self.__store(doc, None)
+        return {'ok': 1.0, 'err': None, 'n': len(matched)}
+
+    def find_and_modify(self, query={}, update=None, upsert=False, sort=None,
+                        full_response=False, manipulate=False, **kwargs):
+        new = kwargs.pop('new', False)
+        fields = kwargs.pop('fields', None)
+        remove = kwargs.pop('remove', False)
+        if remove == bool(update):
+            raise OperationFailure('need exactly one of remove or update')
+
+        with self.__lock:
+            matched = [d for d in self.__candidates(query) if _match(d, query)]
+            if sort:
+                matched = _sort(matched, _sort_spec(sort))
+
+            if not matched:
+                if not upsert or remove:
+                    rv = None
+                else:
+                    upserted = self.update(query, update, upsert=True)
+                    rv = self.__docs[_hashable(upserted['upserted'])] \
+                        if new else None
+            elif remove:
+                rv = matched[0]
+                self.__store(rv, None)
+            else:
+                old = matched[0]
+                updated = _apply_update(old, update)
+                self.__store(old, updated)
+                rv = updated if new else old
+
+            if rv is not None:
+                project = _projector(fields)
+                if project is not None:
+                    rv = project(rv)
+                rv = _copy(rv)
+
+        if full_response:
+            return {'ok': 1.0, 'value': rv}
+        return rv
+
+    def initialize_ordered_bulk_op(self):
+        return _BulkOperation(self, True)
+
+    def initialize_unordered_bulk_op(self):
+        return _BulkOperation(self, False)
+
+    # Indexes
+
+    def create_index(self, key_or_list, cache_for=300, **kwargs):
+        keys = _sort_spec(key_or_list, 1)
+        name = kwargs.pop('name', None) or _index_name(keys)
+        for k in ('drop_dups', 'dropDups', 'background', 'ttl'):
+            kwargs.pop(k, None)
+        with self.__lock:
+            self.__ensure_exists()
+            if name in self.__indexes or name == '_id_':
+                return name
+            index = _Index(name, keys, **kwargs)
+            for h, doc in self.__docs.items():
+                index.check(doc, h)
+                index.add(doc, h)
+            self.__indexes[name] = index
+        return name
+
+    def ensure_index(self, key_or_list, cache_for=300, **kwargs):
+        keys = _sort_spec(key_or_list, 1)
+        name = kwargs.get('name') or _index_name(keys)
+        if name in self.__indexes:
+            return None
+        return self.create_index(key_or_list, cache_for, **kwargs)
+
+    def drop_index(self, index_or_name):
+        name = index_or_name
+        if not isinstance(name, string_types):
+            name = _index_name(_sort_spec(index_or_name, 1))
+        with self.__lock:
+            if name not in self.__indexes:
+                raise OperationFailure('index not found with name [%s]' % name)
+            del self.__indexes[name]
+
+    def drop_indexes(self):
+        with self.__lock:
+            self.__indexes.clear()
+
+    def index_information(self):
+        if not self._exists:
+            return {}
+        rv = {'_id_': {'key': [('_id', 1)], 'v': 1}}
+        for name, index in self.__indexes.items():
+            rv[name] = index.info()
+        return rv
+
+    def reindex(self):
+        return {'ok': 1.0}
+
+    # Aggregation
+
+    def aggregate(self, pipeline, **kwargs):
+        if isinstance(pipeline, dict):
+            pipeline = [pipeline]
+        results = _aggregate(self._query({}), pipeline)
+        if 'cursor' in kwargs:
+            return _CommandCursor(results)
+        return {'ok': 1.0, 'result': results}
+
+    def group(self, *args, **kwargs):
+        raise NotImplementedError(
+            'group is not supported by the memory backend')
+
+    def drop(self):
+        self.database.drop_collection(self.name)
+
+
+def _expression(doc, expr):
+    if isinstance(expr, string_types) and expr[:1] == '$':
+        return _get(doc, expr[1:])
+    if isinstance(expr, dict):
+        if len(expr) == 1 and '$literal' in expr:
+            return expr['$literal']
+        if _is_operator(expr):
+            raise NotImplementedError(
+                'expression %s is not supported by the memory backend' %
+                list(expr)[0])
+        return dict((k, _expression(doc, v)) for k, v in expr.items())
+    if isinstance(expr, list):
+        return [_expression(doc, v) for v in expr]
+    return expr
+
+
+def _numbers(values):
+    return [
+        v for v in values
+        if isinstance(v, numbers.Number) and not isinstance(v, bool)
+    ]
+
+
+def _accumulate(op, values):
+    if op == '$sum':
+        return sum(_numbers(values))
+    elif op == '$avg':
+        nums = _numbers(values)
+        return sum(nums) / float(len(nums)) if nums else None
+    elif op in ('$min', '$max'):
+        present = [v for v in values if v is not None]
+        if not present:
+            return None
+        pick = min if op == '$min' else max
+        return pick(present, key=_sort_key)
+    elif op == '$first':
+        return values[0] if values else None
+    elif op == '$last':
+        return values[-1] if values else None
+    elif op == '$push':
+        return values
+    elif op == '$addToSet':
+        rv = []
+        for v in values:
+            if not any(_eq(v, r) for r in rv):
+                rv.append(v)
+        return rv
+    raise NotImplementedError(
+        'accumulator %s is not supported by the memory backend' % op)
+
+
+def _group(docs, spec):
+    spec = dict(spec)
+    key_expr = spec.pop('_id')
+    groups = OrderedDict()
+    for doc in docs:
+        key = _expression(doc, key_expr)
+        groups.setdefault(_hashable(key), (key, []))[1].append(doc)
+
+    rv = []
+    for key, members in groups.values():
+        out = {'_id': key}
+        for field, acc in spec.items():
+            (op, expr), = acc.items()
+            values = [_expression(d, expr) for d in members]
+            out[field] = _accumulate(op, values)
+        rv.append(out)
+    return rv
+
+
+def _project_stage(docs, spec):
+    spec = dict(spec)
+    include_id = spec.pop('_id', 1)
+    if spec and all(v in (0, False) for v in spec.values()):
+        project = _projector(dict(spec, _id=include_id))
+        return [project(d) for d in docs]
+
+    rv = []
+    for doc in docs:
+        out = {}
+        if include_id in (1, True):
+            if '_id' in doc:
+                out['_id'] = doc['_id']
+        elif include_id not in (0, False):
+            out['_id'] = _expression(doc, include_id)
+        for k, v in spec.items():
+            if v is True or v == 1 and not isinstance(v, bool):
+                value = _values(doc, k.split('.'))
+                if value:
+                    node, key = _container(out, k)
+                    node[key] = value[0]
+            else:
+                node, key = _container(out, k)
+                node[key] = _expression(doc, v)
+        rv.append(out)
+    return rv
+
+
+def _unwind(docs, spec):
+    preserve = False
+    if isinstance(spec, dict):
+        preserve = spec.get('preserveNullAndEmptyArrays', False)
+        spec = spec['path']
+    path = spec[1:]
+    rv = []
+    for doc in docs:
+        value = _get(doc, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                out = _copy(doc)
+                node, key = _container(out, path)
+                node[key] = item
+                rv.append(out)
+        elif value is not None and not isinstance(value, list):
+            rv.append(doc)
+        elif preserve:
+            rv.append(doc)
+    return rv
+
+
+def _aggregate(docs, pipeline):
+    for stage in pipeline:
+        (op, arg), = stage.items()
+        if op == '$match':
+            docs = [d for d in docs if _match(d, arg)]
+        elif op == '$project':
+            docs = _project_stage(docs, arg)
+        elif op == '$sort':
+            docs = _sort(list(docs), _sort_spec(arg))
+        elif op == '$skip':
+            docs = docs[arg:]
+        elif op == '$limit':
+            docs = docs[:arg]
+        elif op == '$unwind':
+            docs = _unwind(docs, arg)
+        elif op == '$group':
+            docs = _group(docs, arg)
+        else:
+            raise NotImplementedError(
+                '%s is not supported by the memory backend' % op)
+    return docs
+
+
+class MemoryDatabase(object):
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.__collections = {}
+        self.__lock = threading.Lock()
+
+    def __repr__(self):
+        return 'MemoryDatabase(%r)' % self.name
+
+    def __getitem__(self, name):
+        with self.__lock:
+            coll = self.__collections.get(name)
+            if coll is None:
+                coll = MemoryCollection(self, name)
+                self.__collections[name] = coll
+            return coll
+
+    def _created(self, collection):
+        self.client._created(self)
+
+    def collection_names(self, include_system_collections=True):
+        names = sorted(
+            name for name, coll in self.__collections.items()
+            if coll._exists
+        )
+        if include_system_collections and names:
+            names.insert(0, 'system.indexes')
+        return names
+
+    def drop_collection(self, name_or_collection):
+        name = name_or_collection
+        if isinstance(name, MemoryCollection):
+            name = name.name
+        coll = self.__collections.get(name)
+        if coll is not None:
+            coll._reset()
+
+    def _drop(self):
+        for coll in self.__collections.values():
+            coll._reset()
+
+    def command(self, command, value=None, **kwargs):
+        if command == 'createIndexes':
+            coll = self[value]
+            for spec in kwargs['indexes']:
+                options = dict(spec)
+                keys = list(options.pop('key').items())
+                coll.create_index(keys, **options)
+            return {'ok': 1.0}
+        elif command == 'ping':
+            return {'ok': 1.0}
+        raise NotImplementedError(
+            'the %s command is not supported by the memory backend' %
+            command)
+
+
+class MemoryClient(object):
+
+    '''
+    Takes the same host and port (or a MongoDB URI as the host) as
+    MongoClient. Other arguments are accepted and ignored.
+    '''
+
+    def __init__(self, host=None, port=None, **kwargs):
+        self.__default_database = None
+        if host is None:
+            host = 'localhost'
+        if host.startswith('mongodb://'):
+            parsed = uri_parser.parse_uri(host, port or 27017)
+            host, port = parsed['nodelist'][0]
+            self.__default_database = parsed['database']
+        self.host = host
+        self.port = port or 27017
+        with _servers_lock:
+            self.__databases = _servers.setdefault(
+                (self.host, self.port), {})
+
+    def __getitem__(self, name):
+        with _servers_lock:
+            db = self.__databases.get(name)
+            if db is None:
+                db = MemoryDatabase(self, name)
+                self.__databases[name] = db
+            return db
+
+    def _created(self, database):
+        pass
+
+    def get_default_database(self):
+        if self.__default_database is None:
+            raise ConfigurationError('No default database defined')
+        return self[self.__default_database]
+
+    def database_names(self):
+        return sorted(
+            name for name, db in self.__databases.items()
+            if db.collection_names()
+        )
+
+    def drop_database(self, name_or_database):
+        name = name_or_database
+        if isinstance(name, MemoryDatabase):
+            name = name.name
+        db = self.__databases.get(name)
+        if db is not None:
+            db._drop()
+
+    def authenticate(self, *args, **kwargs):
+        return True
+
+    def close(self):
+        pass
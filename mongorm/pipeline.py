@@ -0,0 +1,144 @@
+from bson.son import SON
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class Pipeline(object):
+
+    '''
+    Builds an aggregation pipeline for a Document class, one stage per
+    method call, and runs it when iterated. Field names, in queries, field
+    references ('$field') and output names, may be given camelCased or
+    underscored, and are mapped onto the keys documents are stored with.
+
+    stored_path is the function mapping a dotted name onto stored keys, and
+    run the one running the stages and returning a Cursor. Results are
+    streamed off a server-side cursor, batch_size at a time, as documents
+    (loaded as from_raw would) or, with raw=True, plain dicts.
+    allow_disk_use lets the server spill large $group and $sort stages to
+    disk.
+    '''
+
+    def __init__(self, document, stored_path, run, allow_disk_use=False,
+                 batch_size=100, raw=False):
+        self.__document__ = document
+        self.__stored_path__ = stored_path
+        self.__run__ = run
+        self.allow_disk_use = allow_disk_use
+        self.batch_size = batch_size
+        self.raw = raw
+        self.stages = []
+
+    def __repr__(self):
+        return 'Pipeline(%s, %r)' % (self.__document__.__name__, self.stages)
+
+    def __field(self, name):
+        return self.__stored_path__(name)
+
+    def __expr(self, expr):
+        '''
+        Map field references in an expression. Keys are left alone, being
+        operators or their argument names (initialValue, onError...).
+        '''
+        if isinstance(expr, string_types):
+            if expr[:1] == '$' and expr[:2] != '$$':
+                return '$' + self.__field(expr[1:])
+            return expr
+        elif isinstance(expr, dict):
+            return dict((k, self.__expr(v)) for k, v in expr.items())
+        elif isinstance(expr, (list, tuple)):
+            return [self.__expr(v) for v in expr]
+        return expr
+
+    def __outputs(self, exprs):
+        '''
+        Map the output names of a $project or $group, and the field
+        references in their expressions.
+        '''
+        return dict(
+            (k if k[:1] == '$' else self.__field(k), self.__expr(v))
+            for k, v in exprs.items()
+        )
+
+    def __query(self, spec):
+        '''
+        Map the field names in a find-style query.
+        '''
+        rv = {}
+        for k, v in spec.items():
+            if k in ('$and', '$or', '$nor'):
+                rv[k] = [self.__query(s) for s in v]
+            elif k[:1] == '$':
+                rv[k] = v
+            else:
+                if isinstance(v, dict) and '$elemMatch' in v:
+                    v = dict(v)
+                    v['$elemMatch'] = self.__query(v['$elemMatch'])
+                rv[self.__field(k)] = v
+        return rv
+
+    def stage(self, stage):
+        '''
+        Add a stage as-is, without mapping any field names.
+        '''
+        self.stages.append(stage)
+        return self
+
+    def match(self, spec):
+        return self.stage({'$match': self.__query(spec)})
+
+    def project(self, *fields, **exprs):
+        '''
+        Keep the named fields (and _id), and add any computed ones:
+        project('name', total={'$add': ['$a', '$b']}).
+        '''
+        spec = dict((self.__field(f), 1) for f in fields)
+        spec.update(self.__outputs(exprs))
+        return self.stage({'$project': spec})
+
+    def group(self, by, **accumulators):
+        '''
+        Group by an expression (e.g. '$country', or None for everything),
+        computing each keyword argument: group('$country', total={'$sum':
+        '$amount'}).
+        '''
+        if isinstance(by, dict):
+            by = self.__outputs(by)
+        spec = {'_id': self.__expr(by)}
+        spec.update(self.__outputs(accumulators))
+        return self.stage({'$group': spec})
+
+    def unwind(self, field):
+        return self.stage({'$unwind': '$' + self.__field(field.lstrip('$'))})
+
+    def sort(self, key_or_list, direction=1):
+        if isinstance(key_or_list, string_types):
+            key_or_list = [(key_or_list, direction)]
+        spec = [(self.__field(k), d) for k, d in key_or_list]
+        # $sort needs an ordered document
+        return self.stage({'$sort': SON(spec)})
+
+    def skip(self, n):
+        return self.stage({'$skip': n})
+
+    def limit(self, n):
+        return self.stage({'$limit': n})
+
+    def cursor(self, prefetch=0):
+        '''
+        Run the pipeline, returning a mongorm Cursor over the results. With
+        prefetch, batches are read ahead on a background thread, as with
+        find.
+        '''
+        return self.__run__(
+            self.stages, self.allow_disk_use, self.batch_size, self.raw,
+            prefetch)
+
+    def __iter__(self):
+        return iter(self.cursor())
+
+    def to_json(self):
+        return self.cursor().to_json()
@@ -0,0 +1,175 @@
+from bson import ObjectId
+import datetime
+import functools
+
+
+class Record(object):
+
+    '''
+    Base for the __slots__ classes generated for compact documents. A
+    record holds exactly the fields in its class's __fields__ (plus _id),
+    as attributes; fields that weren't set are left out of dump_dict and
+    to_dict. Nested specs become nested records.
+
+    A field may share its name with a method (items, keys, to_dict...), in
+    which case the field wins on instances; Record.to_dict(record) and the
+    like still work, and nothing here relies on the methods themselves.
+    '''
+
+    __slots__ = ()
+
+    # Set on each generated class
+    __document__ = None
+    __converters__ = ()
+    __camelise_key__ = None
+
+    def __init__(self, **kwargs):
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+    @classmethod
+    def from_dict(cls, d):
+        '''
+        Build a record from a dict as stored in the collection. Keys that
+        aren't declared are ignored.
+        '''
+        rv = cls.__new__(cls)
+        for k, convert in cls.__converters__:
+            try:
+                v = d[k]
+            except KeyError:
+                continue
+            if convert is not None and v is not None:
+                v = convert(v)
+            setattr(rv, k, v)
+        return rv
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def keys(self):
+        return [k for k, _ in _items(self)]
+
+    def items(self):
+        return _items(self)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and _items(self) == _items(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % item for item in _items(self)))
+
+    def to_dict(self):
+        '''
+        Returns the record as plain dicts, keyed as stored.
+        '''
+        return _export(self)
+
+    def dump_dict(self):
+        '''
+        Returns the record as Document.dump_dict would: keys camelCased,
+        ObjectIds as strings and dates in ISO 8601.
+        '''
+        return _export(self, type(self).__camelise_key__)
+
+    def to_document(self):
+        '''
+        Returns a Document with this record's fields. If the record has an
+        _id, saving the document sets those fields, and leaves any others
+        in the stored document alone.
+        '''
+        d = _export(self)
+        if '_id' not in d:
+            rv = type(self).__document__()
+        else:
+            rv = type(self).__document__.from_raw(
+                {'_id': d['_id']}, partial=frozenset(d))
+        rv.update(d)
+        return rv
+
+
+def _items(record):
+    rv = []
+    for k in type(record).__slots__:
+        try:
+            rv.append((k, getattr(record, k)))
+        except AttributeError:
+            pass
+    return rv
+
+
+def _export(value, key=None):
+    if isinstance(value, Record):
+        return dict(
+            (k if key is None else key(k), _export(v, key))
+            for k, v in _items(value)
+        )
+    elif isinstance(value, list):
+        return [_export(v, key) for v in value]
+    elif isinstance(value, dict):
+        if key is None:
+            return dict((k, _export(v)) for k, v in value.items())
+        return dict((key(k), _export(v, key)) for k, v in value.items())
+    elif key is not None and type(value) is ObjectId:
+        return str(value)
+    elif key is not None and \
+            isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _loader(cls):
+    # cls.from_dict may be shadowed by a field of that name
+    return functools.partial(Record.from_dict.__func__, cls)
+
+
+def _list_of(convert):
+    return lambda lst: [
+        convert(v) if v is not None else v for v in lst
+    ]
+
+
+def record_class(name, spec, document, camelise_key, top=True):
+    '''
+    Generate the Record subclass for a __fields__-style spec, and those for
+    any nested specs within it.
+    '''
+    converters = []
+    for k, v in sorted(spec.items()):
+        convert = None
+        if type(v) is dict:
+            convert = _loader(record_class(
+                name + '.' + k, v, document, camelise_key, False))
+        elif type(v) is list:
+            if type(v[0]) is dict:
+                convert = _list_of(_loader(record_class(
+                    name + '.' + k, v[0], document, camelise_key, False)))
+            else:
+                convert = list
+        converters.append((k, convert))
+
+    if top and '_id' not in spec:
+        converters.insert(0, ('_id', None))
+
+    return type(name, (Record, ), {
+        '__slots__': tuple(k for k, _ in converters),
+        '__document__': document,
+        '__converters__': tuple(converters),
+        '__camelise_key__': camelise_key
+    })
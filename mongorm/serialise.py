@@ -0,0 +1,78 @@
+'''
+The JSON backend used by dump_json, load_json and friends.
+
+The backend is picked once, at import, from the MONGORM_JSON_BACKEND
+environment variable: 'json' (the standard library, and the default),
+'simplejson' or 'orjson'. set_json_backend switches it at runtime.
+
+orjson is by far the fastest, but isn't the default since its output is
+compact ('{"a":1}' rather than '{"a": 1}').
+'''
+
+import os
+
+
+class JSONBackend(object):
+
+    '''
+    A named pair of dumps and loads functions. dumps returns a str. It's
+    handed plain JSON types only: dump_dict has already turned ObjectIds
+    into strings and dates into ISO 8601.
+    '''
+
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        # What dumps puts between array items, for joining arrays up
+        self.separator = dumps([0, 0])[2:-2]
+
+    def __repr__(self):
+        return 'JSONBackend(%r)' % self.name
+
+
+def _stdlib():
+    import json
+    from mongorm.utils import JSONEncoder
+    return JSONBackend('json', JSONEncoder().encode, json.loads)
+
+
+def _simplejson():
+    import simplejson
+    # DotDicts would pass for namedtuples, having every attribute
+    encoder = simplejson.JSONEncoder(namedtuple_as_object=False)
+    return JSONBackend('simplejson', encoder.encode, simplejson.loads)
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+
+    return JSONBackend('orjson', dumps, orjson.loads)
+
+
+BACKENDS = {
+    'json': _stdlib,
+    'simplejson': _simplejson,
+    'orjson': _orjson
+}
+
+
+def set_json_backend(name):
+    '''
+    Switch the JSON backend, by name. Raises ImportError if it isn't
+    installed, or ValueError if there's no such backend.
+    '''
+    global backend
+
+    if name not in BACKENDS:
+        raise ValueError('unknown JSON backend: %s' % name)
+    backend = BACKENDS[name]()
+
+    return backend
+
+
+backend = None
+set_json_backend(os.environ.get('MONGORM_JSON_BACKEND', 'json'))
@@ -1,21 +1,26 @@
 from bson import ObjectId
+from collections import OrderedDict
 import json
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 
 class DotDict(dict):
 
+    try:
+        iteritems = dict.iteritems
+    except AttributeError:
+        iteritems = dict.items
+
     def __init__(self, *args, **kwargs):
         super(DotDict, self).__init__(*args, **kwargs)
-        try:
-            dict.__getattribute__(self, 'iteritems')
-        except AttributeError:
-            dict.__setattr__(
-                self,
-                'iteritems',
-                dict.__getattribute__(self, 'items')
-            )
         for k, v in self.iteritems():
-            self[k] = DotDict.__dotify(v)
+            dict.__setitem__(self, k, DotDict.__dotify(v))
 
     def __getattr__(self, name):
         if name[:2] == '__':
@@ -34,8 +39,7 @@ class DotDict(dict):
         if name[:2] == '__':
             object.__setattr__(self, name, value)
         else:
-            value = DotDict.__dotify(value)
-            super(DotDict, self).__setitem__(name, value)
+            self.__setitem__(name, value)
 
     def __setitem__(self, name, value):
 
@@ -51,31 +55,263 @@ class DotDict(dict):
             f = dct.items
 
         for k, v in f():
-            dct[k] = DotDict.__dotify(v)
-        super(DotDict, self).update(dct)
+            dict.__setitem__(self, k, DotDict.__dotify(v))
 
     @staticmethod
     def __dotify(dct):
 
         if issubclass(type(dct), dict):
 
-            for k, v in DotDict(dct).iteritems():
-                dct[k] = DotDict.__dotify(v)
+            rv = DotDict()
+            for k, v in dict.items(dct):
+                dict.__setitem__(rv, k, DotDict.__dotify(v))
 
-            return DotDict(dct)
+            return rv
 
         elif issubclass(type(dct), list):
 
-            for i, v in enumerate(dct):
-                dct[i] = DotDict.__dotify(v)
-
-            return dct
+            return [DotDict.__dotify(v) for v in dct]
 
         else:
 
             return dct
 
 
+class LazyDotDict(DotDict):
+
+    '''
+    A DotDict that leaves nested dicts and lists untouched until they're
+    first accessed, at which point the converted value replaces the
+    original in place.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+
+    def __getitem__(self, name):
+        value = dict.__getitem__(self, name)
+        typ = type(value)
+        if typ is dict:
+            value = LazyDotDict(value)
+            dict.__setitem__(self, name, value)
+        elif typ is list:
+            value = LazyList(value)
+            dict.__setitem__(self, name, value)
+        return value
+
+    def __setitem__(self, name, value):
+        dict.__setitem__(self, name, value)
+
+    def get(self, name, default=None):
+        if name in self:
+            return self.__getitem__(name)
+        return default
+
+    def update(self, dct):
+        dict.update(self, dct)
+
+
+class LazyList(list):
+
+    '''
+    The list counterpart of LazyDotDict; elements are converted one level
+    deep when the list itself is first accessed.
+    '''
+
+    def __init__(self, lst=()):
+        super(LazyList, self).__init__(
+            LazyDotDict(v) if type(v) is dict else
+            LazyList(v) if type(v) is list else v
+            for v in lst
+        )
+
+
+class InflectionCache(object):
+
+    '''
+    Memoises a key inflection function (underscore, camelise). Schemas use
+    a limited set of key names, so each only needs to go through the regexes
+    once. The cache is bounded; when it fills up it's emptied and refilled.
+    '''
+
+    def __init__(self, fn, maxsize=4096):
+        self.fn = fn
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__cache = {}
+
+    def __call__(self, key):
+        try:
+            rv = self.__cache[key]
+        except KeyError:
+            self.misses += 1
+            rv = self.fn(key)
+            if len(self.__cache) >= self.maxsize:
+                self.__cache.clear()
+            self.__cache[key] = rv
+            return rv
+        self.hits += 1
+        return rv
+
+    def clear(self):
+        self.__cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        return DotDict(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            size=len(self.__cache)
+        )
+
+
+class KeyMap(object):
+
+    '''
+    Inflections precomputed for a known set of keys, e.g. those in a
+    class's __fields__, with anything else going to a shared cache.
+    '''
+
+    def __init__(self, keys, cache):
+        self.cache = cache
+        self.keys = dict((k, cache.fn(k)) for k in keys)
+
+    def __call__(self, key):
+        try:
+            return self.keys[key]
+        except KeyError:
+            return self.cache(key)
+
+
+class LRUCache(object):
+
+    '''
+    A bounded mapping that evicts its least recently used entry when full.
+    With a ttl (in seconds), entries also expire that long after they were
+    stored. Keeps hit and miss counts. Safe to share between threads.
+    '''
+
+    def __init__(self, maxsize=1000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.__lock:
+            try:
+                expires, value = self.__data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.time():
+                self.misses += 1
+                return default
+            self.__data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self.__lock:
+            self.__data.pop(key, None)
+            self.__data[key] = (expires, value)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.__lock:
+            try:
+                return self.__data.pop(key)[1]
+            except KeyError:
+                return default
+
+    def discard_if(self, predicate):
+        '''
+        Drop every entry for which predicate(key, value) is true.
+        '''
+        with self.__lock:
+            for key, (expires, value) in list(self.__data.items()):
+                if predicate(key, value):
+                    del self.__data[key]
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__data)
+
+    def info(self):
+        return DotDict(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            size=len(self.__data)
+        )
+
+
+def iter_threaded(producers, maxsize):
+    '''
+    Run each producer on a daemon thread of its own, and iterate over what
+    they produce, in the order it arrives. A producer is called with put,
+    which hands an item over and returns False once the consumer has gone
+    away (the iterator was closed), when the producer should stop.
+
+    Items pass through a queue of at most maxsize, so producers wait for a
+    slow consumer. An exception in a producer is raised to the consumer,
+    and closing the iterator stops and joins every thread.
+    '''
+
+    done = object()
+    stop = threading.Event()
+    items = queue.Queue(maxsize=maxsize)
+
+    def put(item):
+        # Keep an eye out for stop, in case nobody's reading any more
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(producer):
+        try:
+            producer(lambda item: put((item, None)))
+        except Exception as e:
+            put((None, e))
+        put((done, None))
+
+    threads = [threading.Thread(target=run, args=(p, )) for p in producers]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    running = len(threads)
+    try:
+        while running:
+            item, e = items.get()
+            if e is not None:
+                raise e
+            if item is done:
+                running -= 1
+            else:
+                yield item
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+
 class JSONEncoder(json.JSONEncoder):
 
     def default(self, o):
@@ -33,7 +33,7 @@ if __name__ == '__main__':
         ],
         test_suite='tests',
         install_requires=[
-            'pymongo',
+            'pymongo>=2.7',
             'inflection',
         ],
     )
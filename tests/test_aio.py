@@ -0,0 +1,100 @@
+import io
+import sys
+import unittest
+
+if sys.version_info >= (3, 7):
+    import asyncio
+    from mongorm.aio import AsyncDatabase
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires asyncio and contextvars')
+class AsyncDocumentTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db = AsyncDatabase(
+            uri='mongodb://localhost:27017/orm_test_aio', max_workers=4)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.drop()
+        cls.db.close()
+
+    def setUp(self):
+        class SomeTestClass(self.db.Document):
+            pass
+
+        self.SomeTestClass = SomeTestClass
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.db.drop_collection(self.SomeTestClass)
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_save_find_one(self):
+        d = self.SomeTestClass()
+        d.hello = 'world'
+        self.run_async(d.save())
+        self.assertIn('_id', d)
+
+        e = self.run_async(self.SomeTestClass.find_one({'_id': d._id}))
+        self.assertIsInstance(e, self.SomeTestClass)
+        self.assertEqual(e.hello, 'world')
+
+    def test_find(self):
+        docs = [self.SomeTestClass(n=i) for i in range(5)]
+        self.run_async(self.SomeTestClass.save_many(docs))
+
+        cursor = self.SomeTestClass.find().sort('n').skip(1)
+        rv = self.run_async(cursor.to_list())
+        self.assertEqual([d.n for d in rv], [1, 2, 3, 4])
+
+    def test_delete(self):
+        d = self.SomeTestClass()
+        self.run_async(d.save())
+        self.run_async(d.delete())
+
+        e = self.run_async(self.SomeTestClass.find_one({'_id': d._id}))
+        self.assertIsNone(e)
+
+    def test_inherited_queries(self):
+        docs = [self.SomeTestClass(n=i) for i in range(5)]
+        self.run_async(self.SomeTestClass.save_many(docs))
+
+        page = self.run_async(self.SomeTestClass.paginate(sort='n', limit=3))
+        self.assertEqual([d.n for d in page.documents], [0, 1, 2])
+
+        rv = self.run_async(self.SomeTestClass.parallel_scan(
+            workers=2, fn=lambda d: d.n))
+        self.assertEqual(sorted(rv), [0, 1, 2, 3, 4])
+        rv = self.run_async(self.SomeTestClass.parallel_scan(
+            fn=lambda d: d.n, reduce=lambda a, b: a + b))
+        self.assertEqual(rv, 10)
+
+        out = io.StringIO()
+        self.assertEqual(
+            self.run_async(self.SomeTestClass.export_jsonl(out)), 5)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+    def test_atomic_updates(self):
+        d = self.SomeTestClass(n=1, tags=[])
+        self.run_async(d.save())
+
+        self.assertIs(self.run_async(d.inc('n', 2)), d)
+        self.run_async(d.push('tags', 'a'))
+        self.run_async(self.SomeTestClass.set_fields(d._id, name='x'))
+        e = self.run_async(self.SomeTestClass.find_one({'_id': d._id}))
+        self.assertEqual((e.n, e.tags, e.name), (3, ['a'], 'x'))
+
+    def test_pipeline(self):
+        docs = [self.SomeTestClass(n=i, odd=i % 2) for i in range(5)]
+        self.run_async(self.SomeTestClass.save_many(docs))
+
+        pipeline = self.SomeTestClass.pipeline(raw=True) \
+            .group('$odd', total={'$sum': '$n'}).sort('_id')
+        self.assertRaises(TypeError, list, pipeline)
+        rv = self.run_async(pipeline.to_list())
+        self.assertEqual(rv, [{'_id': 0, 'total': 6}, {'_id': 1, 'total': 4}])
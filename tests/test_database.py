@@ -1,6 +1,8 @@
+import pymongo
 import unittest
 
-from mongorm import Database
+from mongorm import Database, Index
+from mongorm.memory import MemoryClient
 
 
 class DatabaseTestCase(unittest.TestCase):
@@ -33,6 +35,23 @@ class DatabaseTestCase(unittest.TestCase):
         self.assertEquals(db.port, 27017)
         self.assertEquals(db.name, 'test')
 
+    def test_replica_set_client(self):
+        class ReplicaSetClient(MemoryClient):
+            pass
+
+        class ReplicaSetDatabase(Database):
+            REPLICA_SET_BACKENDS = {'memory': ReplicaSetClient}
+
+        db = ReplicaSetDatabase(
+            backend='memory', uri='mongodb://localhost:27017/orm_test')
+        self.assertNotIsInstance(db.__client__, ReplicaSetClient)
+        db = ReplicaSetDatabase(
+            backend='memory',
+            uri='mongodb://localhost:27017/orm_test?replicaSet=rs0')
+        self.assertIsInstance(db.__client__, ReplicaSetClient)
+        db = ReplicaSetDatabase(backend='memory', replicaSet='rs0')
+        self.assertIsInstance(db.__client__, ReplicaSetClient)
+
     def test_drop_collection_from_str(self):
         class SomeTestClass(self.db.Document):
             pass
@@ -69,3 +88,122 @@ class DatabaseTestCase(unittest.TestCase):
             self.db.drop_collection,
             5
         )
+
+    def test_session_identity_map(self):
+        class SomeTestClass(self.db.Document):
+            pass
+
+        t = SomeTestClass()
+        t.test_val = 44
+        t.save()
+
+        with self.db.session() as identity_map:
+            a = SomeTestClass.find_one({'_id': t._id})
+            b = SomeTestClass.find_one(t._id)
+            c = list(SomeTestClass.find({'test_val': 44}))[0]
+            self.assertIs(a, b)
+            self.assertIs(a, c)
+            self.assertEquals(identity_map.info().hits, 2)
+            self.assertEquals(identity_map.info().misses, 1)
+
+            a.delete()
+            self.assertIsNone(SomeTestClass.find_one(t._id))
+
+            t.save()
+            self.assertIs(SomeTestClass.find_one(t._id), t)
+
+        self.assertIsNone(self.db.identity_map)
+        self.assertIsNot(SomeTestClass.find_one(t._id), t)
+
+        # Compound _ids can't go in the map, and are simply left out
+        _id = {'day': 1, 'n': 2}
+        with self.db.session() as identity_map:
+            SomeTestClass.__coll__.insert({'_id': _id, 'test_val': 45})
+            a = SomeTestClass.find_one({'_id': _id})
+            self.assertEquals(a.test_val, 45)
+            self.assertEquals(
+                [d._id for d in SomeTestClass.find({'test_val': 45})], [_id])
+            a.delete()
+            self.assertIsNone(SomeTestClass.find_one({'_id': _id}))
+            self.assertEquals(len(identity_map), 0)
+        self.db.drop_collection(SomeTestClass)
+
+    def test_session_eviction(self):
+        class SomeTestClass(self.db.Document):
+            pass
+
+        docs = [SomeTestClass(n=i) for i in range(3)]
+        SomeTestClass.save_many(docs)
+
+        with self.db.session(maxsize=2) as identity_map:
+            for d in SomeTestClass.find():
+                pass
+            self.assertEquals(len(identity_map), 2)
+
+        self.db.drop_collection(SomeTestClass)
+
+    def test_sync_indexes(self):
+        db = Database(uri='mongodb://localhost:27017/orm_test',
+                      defer_indexes=True)
+
+        class SomeTestClass(db.Document):
+            __indices__ = [
+                Index('hello'),
+                Index([('test', pymongo.ASCENDING)], unique=True),
+            ]
+
+        SomeTestClass(hello='world').save()
+        self.assertEquals(len(SomeTestClass.index_information()), 1)
+
+        self.assertEquals(db.sync_indexes(), {
+            'some_test_class': ['hello_1', 'test_1']
+        })
+        indices = SomeTestClass.index_information()
+        self.assertEquals(len(indices), 3)
+        self.assertTrue(indices['test_1']['unique'])
+
+        self.assertEquals(db.sync_indexes(), {})
+        self.db.drop_collection(SomeTestClass)
+
+    def test_listeners(self):
+        class SomeTestClass(self.db.Document):
+            pass
+
+        events = []
+        self.db.add_listener(events.append)
+
+        t = SomeTestClass(test_val=44)
+        t.save()
+        d = SomeTestClass.find_one(t._id)
+        self.assertEquals(len(list(SomeTestClass.find())), 1)
+        d.test_val = 45
+        d.save()
+        SomeTestClass.save_many([SomeTestClass(test_val=46)])
+        d.load_json(d.dump_json())
+        d.delete()
+
+        self.db.remove_listener(events.append)
+        SomeTestClass.find_one(t._id)
+
+        self.assertEquals([e.op for e in events], [
+            'save', 'find_one', 'find', 'save', 'save_many',
+            'dump_json', 'load_json', 'delete'
+        ])
+        for e in events:
+            self.assertEquals(e.collection, 'some_test_class')
+            self.assertEquals(e.document, 'SomeTestClass')
+            self.assertGreaterEqual(e.duration, 0)
+
+        self.assertTrue(events[0].full)
+        self.assertSetEqual(
+            set(events[0].phases.keys()), set(['validate', 'diff', 'write']))
+        self.assertGreater(events[0].size, 0)
+        self.assertSetEqual(
+            set(events[1].phases.keys()), set(['query', 'load']))
+        self.assertEquals(events[2].count, 1)
+        self.assertGreater(events[2].size, 0)
+        self.assertFalse(events[3].full)
+        self.assertEquals(events[4].count, 1)
+        self.assertEquals(events[4].errors, 0)
+
+        self.db.drop_collection(SomeTestClass)
@@ -1,8 +1,32 @@
+import datetime
 import unittest
 
-from mongorm import Database, Field, Index, DotDict, GeoJSON
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from bson import ObjectId
+from mongorm import (
+    Cache,
+    Database,
+    DotDict,
+    Field,
+    GeoJSON,
+    Index,
+    LazyDotDict,
+    set_json_backend
+)
+from mongorm import serialise
+from mongorm.document import camelise_key
+from mongorm.record import Record
 import pymongo
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class DocumentTestCase(unittest.TestCase):
 
@@ -40,6 +64,34 @@ class DocumentTestCase(unittest.TestCase):
         test_dict = d.dump_dict()
         self.assertEquals(test_dict, self.sample_dict_cc)
 
+    def test_inflection_cache(self):
+        camelise_key.clear()
+
+        d = self.SomeTestClass()
+        d.load_dict(self.sample_dict_cc)
+        d.dump_dict()
+        d.dump_dict()
+
+        info = camelise_key.info()
+        self.assertEquals(info.misses, 1)
+        self.assertEquals(info.hits, 1)
+        self.assertEquals(info.size, 1)
+
+    def test_inflection_key_map(self):
+        self.SomeTestClass.__fields__ = {
+            'hello_world': Field.optional(str)
+        }
+
+        d = self.SomeTestClass()
+        d.load_dict(self.sample_dict_cc)
+
+        self.assertEquals(d, self.sample_dict_un)
+        self.assertEquals(d.dump_dict(), self.sample_dict_cc)
+        self.assertEquals(
+            self.SomeTestClass.__camelise_key__.keys,
+            {'hello_world': 'helloWorld'}
+        )
+
     def test_load_json(self):
         d = self.SomeTestClass()
         d.load_json(self.sample_json)
@@ -174,6 +226,37 @@ class DocumentTestCase(unittest.TestCase):
         d.validate_fields()
         self.assertListEqual(d.hello, [42, 42])
 
+    def test_validate_fields_declared(self):
+        class OtherTestClass(self.db.Document):
+            __fields__ = {
+                'hello': Field.required(int, 42),
+                'nested': {
+                    'a': Field.required(str, 'x')
+                }
+            }
+
+        d = OtherTestClass()
+        d.validate_fields()
+
+        self.assertEquals(d.hello, 42)
+        self.assertEquals(d.nested.a, 'x')
+
+    def test_validate_fields_extra(self):
+        d = self.SomeTestClass()
+        d.hello = '3'
+        d.validate_fields_extra({
+            'hello': Field.required(int),
+            'world': Field.required(str, 'x')
+        })
+
+        self.assertEquals(d.hello, 3)
+        self.assertEquals(d.world, 'x')
+        self.assertRaises(
+            KeyError,
+            d.validate_fields_extra,
+            {'missing': Field.required(int)}
+        )
+
     def test_validate_fields_list_empty(self):
         self.SomeTestClass.__fields__ = {
             'hello': [
@@ -196,6 +279,592 @@ class DocumentTestCase(unittest.TestCase):
 
         self.assertIn('_id', d)
 
+    def test_save_changes(self):
+        d = self.SomeTestClass()
+        d.a = 1
+        d.b = 1
+        d.nested = {'x': 1, 'y': 1}
+        d.tags = ['a']
+        d.save()
+        self.assertIsNone(d.changes())
+
+        e = self.SomeTestClass.find_one({'_id': d._id})
+        self.assertEquals(e.changes(), {})
+
+        # Simulate someone else writing to the document in the meantime
+        self.SomeTestClass.__coll__.update(
+            {'_id': d._id}, {'$set': {'b': 2, 'nested.y': 2}})
+
+        e.a = 2
+        e.nested.x = 2
+        e.tags.append('b')
+        del e['b']
+        self.assertEquals(e.changes(), {
+            '$set': {'a': 2, 'nested.x': 2, 'tags': ['a', 'b']},
+            '$unset': {'b': ''}
+        })
+        e.save()
+        self.assertEquals(e.changes(), {})
+
+        f = self.SomeTestClass.find_one({'_id': d._id}, raw=True)
+        self.assertEquals(f, {
+            '_id': d._id,
+            'a': 2,
+            'nested': {'x': 2, 'y': 2},
+            'tags': ['a', 'b']
+        })
+
+        # Changes to a document deleted since loading aren't silently lost
+        self.SomeTestClass.__coll__.remove(d._id)
+        e.a = 3
+        self.assertRaises(ValueError, e.save)
+        self.assertRaises(ValueError, e.inc, 'a', fetch=False)
+        self.assertIsNone(self.SomeTestClass.find_one({'_id': d._id}))
+
+    def test_find_only(self):
+        self.SomeTestClass.__fields__ = {
+            'name': Field.required(str),
+            'hits': Field.required(int, 0),
+            'nested': {
+                'key_a': Field.required(str),
+                'key_b': Field.required(int, 0)
+            }
+        }
+
+        d = self.SomeTestClass()
+        d.name = 'a'
+        d.hits = 5
+        d.big = 'x' * 1000
+        d.nested = {'key_a': 'a', 'key_b': 5}
+        d.save()
+
+        e = self.SomeTestClass.find_one(
+            {'_id': d._id}, only=['name', 'nested.keyA'])
+        self.assertEquals(set(e.keys()), set(['_id', 'name', 'nested']))
+        self.assertEquals(e.nested, {'key_a': 'a'})
+
+        e.name = 'b'
+        e.nested.key_a = 'b'
+        e.save()
+
+        f = self.SomeTestClass.find_one({'_id': d._id})
+        self.assertEquals(f.name, 'b')
+        self.assertEquals(f.hits, 5)
+        self.assertEquals(f.big, d.big)
+        self.assertEquals(f.nested, {'key_a': 'b', 'key_b': 5})
+
+        # Fields outside the projection are validated once they're set
+        e = self.SomeTestClass.find_one({'_id': d._id}, only=['name'])
+        e.hits = 'not an int'
+        self.assertRaises(TypeError, e.save)
+        e.hits = '7'
+        e.nested = {'key_a': 'c'}
+        e.save()
+        f = self.SomeTestClass.find_one({'_id': d._id})
+        self.assertEquals(f.hits, 7)
+        self.assertEquals(f.nested, {'key_a': 'c', 'key_b': 0})
+
+        e = list(self.SomeTestClass.find({'_id': d._id}, only=['name']))[0]
+        e.__snapshot__ = None
+        self.assertRaises(ValueError, e.save)
+
+    def test_compact(self):
+        class OtherTestClass(self.db.Document):
+            __compact__ = True
+            __fields__ = {
+                'name': Field.required(str),
+                'nested': {
+                    'key_a': Field.required(str)
+                },
+                'b_list': [{
+                    'key_b': Field.optional(int)
+                }]
+            }
+
+        d = OtherTestClass(name='a', big='x' * 1000)
+        d.nested = {'key_a': 'b'}
+        d.b_list = [{'key_b': 1}, {'key_b': 2}]
+        d.save()
+
+        r = list(OtherTestClass.find({'_id': d._id}, compact=True))[0]
+        self.assertFalse(hasattr(r, '__dict__'))
+        self.assertEquals(r._id, d._id)
+        self.assertEquals(r.name, 'a')
+        self.assertEquals(r.nested.key_a, 'b')
+        self.assertEquals(r.b_list[1].key_b, 2)
+        self.assertNotIn('big', r)
+        self.assertRaises(AttributeError, setattr, r, 'big', 'y')
+        self.assertEquals(r.dump_dict(), {
+            '_id': str(d._id),
+            'name': 'a',
+            'nested': {'keyA': 'b'},
+            'bList': [{'keyB': 1}, {'keyB': 2}]
+        })
+
+        r = OtherTestClass.find_one(d._id, compact=True)
+        r.name = 'c'
+        e = r.to_document()
+        self.assertIsInstance(e, OtherTestClass)
+        e.save()
+        self.assertEquals(OtherTestClass.find_one(d._id).name, 'c')
+        self.assertEquals(OtherTestClass.find_one(d._id).big, d.big)
+
+        self.assertRaises(
+            TypeError, self.SomeTestClass.find_one, d._id, compact=True)
+        self.db.drop_collection(OtherTestClass)
+
+    def test_compact_subclass(self):
+        class OtherTestClass(self.db.Document):
+            __compact__ = True
+            __fields__ = {'name': Field.required(str)}
+
+        class SubTestClass(OtherTestClass):
+            pass
+
+        class PlainTestClass(self.db.Document):
+            __fields__ = {'name': Field.required(str)}
+
+        class CompactTestClass(PlainTestClass):
+            __compact__ = True
+
+        for cls in (SubTestClass, CompactTestClass):
+            self.assertIs(cls.__record__.__document__, cls)
+            d = cls(name='a')
+            d.save()
+            r = cls.find_one(d._id, compact=True)
+            r.name = 'b'
+            e = r.to_document()
+            self.assertIsInstance(e, cls)
+            e.save()
+            self.assertEquals(cls.find_one(d._id).name, 'b')
+            self.db.drop_collection(cls)
+        self.assertIsNone(PlainTestClass.__record__)
+
+    def test_compact_method_names(self):
+        class OtherTestClass(self.db.Document):
+            __compact__ = True
+            __fields__ = {
+                'keys': Field.optional(str),
+                'child': {
+                    'items': [{'from_dict': Field.optional(int)}],
+                    'to_dict': Field.optional(int)
+                }
+            }
+
+        d = OtherTestClass(keys='k', child={'items': [{'from_dict': 1}]})
+        d.save()
+
+        r = OtherTestClass.find_one(d._id, compact=True)
+        self.assertEquals(r.keys, 'k')
+        self.assertEquals(r.child.items[0].from_dict, 1)
+        self.assertEquals(
+            repr(r.child), "OtherTestClassRecord.child(items=[%r])" %
+            r.child.items[0])
+        self.assertEquals(r, list(OtherTestClass.find(compact=True))[0])
+        self.assertEquals(Record.to_dict(r), d)
+        self.assertEquals(Record.dump_dict(r)['child'], {
+            'items': [{'fromDict': 1}]
+        })
+        self.assertEquals(r.to_document(), d)
+        self.db.drop_collection(OtherTestClass)
+
+    def test_find_columns(self):
+        class OtherTestClass(self.db.Document):
+            __fields__ = {
+                'n': Field.required(int),
+                'x': Field.optional(float),
+                'name': Field.optional(str),
+                'nested': {
+                    'flag': Field.optional(bool)
+                }
+            }
+
+        OtherTestClass.save_many([
+            OtherTestClass(n=i, x=i / 2.0, name=str(i), nested={'flag': True})
+            for i in range(3)
+        ] + [OtherTestClass(n=3)])
+
+        cols = OtherTestClass.find_columns(
+            {'n': {'$gte': 1}}, ['n', 'x', 'name', 'nested.flag'],
+            sort=[('n', pymongo.ASCENDING)])
+        self.assertEqual(list(cols.keys()), ['n', 'x', 'name', 'nested.flag'])
+        self.assertEqual(list(cols['n']), [1, 2, 3])
+        self.assertEqual(list(cols['x'][:2]), [0.5, 1.0])
+        self.assertEqual(list(cols['name']), ['1', '2', None])
+        self.assertEqual(list(cols['nested.flag']), [True, True, None])
+
+        if numpy is not None:
+            self.assertEqual(cols['n'].dtype, numpy.int64)
+            self.assertEqual(cols['x'].dtype, numpy.float64)
+            self.assertTrue(numpy.isnan(cols['x'][2]))
+            self.assertEqual(cols['name'].dtype, object)
+        else:
+            self.assertIsNone(cols['x'][2])
+
+        # Values that don't match the declared type aren't coerced
+        OtherTestClass.__coll__.insert({'n': 2.7, 'x': '5'})
+        cols = OtherTestClass.find_columns({}, ['n', 'x'])
+        self.assertEqual(list(cols['n'])[-1], 2.7)
+        self.assertEqual(list(cols['x'])[-1], '5')
+        if numpy is not None:
+            self.assertEqual(cols['n'].dtype, object)
+            self.assertEqual(cols['x'].dtype, object)
+
+        self.db.drop_collection(OtherTestClass)
+
+    def test_parallel_scan(self):
+        class ScanTestClass(self.db.Document):
+            pass
+
+        ScanTestClass.save_many([ScanTestClass(n=i) for i in range(100)])
+
+        rv = ScanTestClass.parallel_scan(workers=3, fn=lambda d: d.n)
+        self.assertEqual(sorted(rv), list(range(100)))
+
+        rv = ScanTestClass.parallel_scan(
+            {'n': {'$lt': 10}}, workers=4, fn=lambda d: d['n'],
+            reduce=lambda a, b: a + b, raw=True)
+        self.assertEqual(rv, 45)
+
+        def fail(d):
+            raise ValueError
+
+        self.assertRaises(
+            ValueError, list, ScanTestClass.parallel_scan(fn=fail))
+
+        # _ids of mixed types aren't split into ranges, so none are missed
+        ScanTestClass.__coll__.insert([{'_id': i, 'n': i} for i in range(10)])
+        rv = list(ScanTestClass.parallel_scan(workers=4, raw=True))
+        self.assertEqual(len(rv), ScanTestClass.count())
+        self.db.drop_collection(ScanTestClass)
+
+    def test_find_prefetch(self):
+        class PrefetchTestClass(self.db.Document):
+            pass
+
+        PrefetchTestClass.save_many(
+            [PrefetchTestClass(n=i) for i in range(25)])
+
+        cursor = PrefetchTestClass.find(prefetch=2, batch_size=4).sort('n')
+        docs = list(cursor)
+        self.assertEqual([d.n for d in docs], list(range(25)))
+        self.assertIsInstance(docs[0], PrefetchTestClass)
+
+        cursor = PrefetchTestClass.find(
+            {'n': {'$gte': 20}}, prefetch=1, raw=True).sort('n')
+        self.assertEqual(next(cursor)['n'], 20)
+        cursor.close()
+        self.assertRaises(StopIteration, next, cursor)
+
+        events = []
+        self.db.add_listener(events.append)
+        self.assertEqual(
+            len(list(PrefetchTestClass.find(prefetch=3, batch_size=10))), 25)
+        self.db.remove_listener(events.append)
+        self.assertEqual(events[-1].count, 25)
+        self.db.drop_collection(PrefetchTestClass)
+
+    def test_paginate(self):
+        class PageTestClass(self.db.Document):
+            pass
+
+        docs = [PageTestClass(n=i, group_key=i % 3) for i in range(10)]
+        docs.append(PageTestClass(n=10))
+        PageTestClass.save_many(docs)
+
+        seen = []
+        token = None
+        while True:
+            page = PageTestClass.paginate(limit=4, token=token)
+            seen.extend(d.n for d in page.documents)
+            token = page.next_token
+            if token is None:
+                break
+        self.assertEqual(seen, list(range(11)))
+
+        pages = []
+        token = None
+        while True:
+            page = PageTestClass.paginate(
+                {'n': {'$lt': 10}}, sort=('groupKey', -1), limit=3,
+                token=token, count=True, raw=True)
+            self.assertEqual(page.total, 10)
+            pages.append([(d['group_key'], d['n']) for d in page.documents])
+            token = page.next_token
+            if token is None:
+                break
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(
+            [item for page in pages for item in page],
+            sorted([(i % 3, i) for i in range(10)], reverse=True))
+
+        seen = []
+        token = None
+        while True:
+            page = PageTestClass.paginate(
+                sort='group_key', limit=2, token=token, only=['n'])
+            seen.extend(d.n for d in page.documents)
+            token = page.next_token
+            if token is None:
+                break
+        self.assertEqual(seen, [10, 0, 3, 6, 9, 1, 4, 7, 2, 5, 8])
+
+        self.assertRaises(
+            ValueError, PageTestClass.paginate, token='not a token')
+        page = PageTestClass.paginate(limit=2)
+        self.assertRaises(
+            ValueError, PageTestClass.paginate, sort='n',
+            token=page.next_token)
+        self.db.drop_collection(PageTestClass)
+
+    def test_atomic_updates(self):
+        d = self.SomeTestClass(views=1, tags=['a'], stats={'hits': 0})
+        d.save()
+        d = self.SomeTestClass.find_one(d._id)
+        d.title = 'unsaved'
+
+        self.SomeTestClass.inc(d._id, 'views', 10)
+        d.inc('views')
+        self.assertEqual(d.views, 12)
+        d.inc({'stats.hits': 2}, fetch=False)
+        self.assertEqual(d.stats.hits, 2)
+        d.push('tags', 'b')
+        d.push('tags', 'a')
+        d.pull('tags', 'a', fetch=False)
+        self.assertEqual(d.tags, ['b'])
+        d.set_fields({'stats.lastSeen': 5}, name='x')
+        self.assertEqual(d.stats.last_seen, 5)
+        self.assertEqual(d.changes(), {'$set': {'title': 'unsaved'}})
+
+        e = self.SomeTestClass.find_one(d._id)
+        self.assertEqual(e.views, 12)
+        self.assertEqual(e.tags, ['b'])
+        self.assertEqual(e.stats, {'hits': 2, 'last_seen': 5})
+        self.assertEqual(e.name, 'x')
+        self.assertNotIn('title', e)
+
+        e = self.SomeTestClass.set_fields(
+            {'name': 'x'}, {'name': 'y'}, fetch=True)
+        self.assertIsInstance(e, self.SomeTestClass)
+        self.assertEqual(e.name, 'y')
+        self.assertIsNone(
+            self.SomeTestClass.inc({'name': 'z'}, 'views', fetch=True))
+
+        self.assertRaises(ValueError, self.SomeTestClass().inc, 'views')
+
+    def test_pipeline(self):
+        class PipelineTestClass(self.db.Document):
+            pass
+
+        PipelineTestClass.save_many([
+            PipelineTestClass(country_code=c, amount=i, tags=['a', 'b'][:i])
+            for i, c in enumerate(['sg', 'sg', 'uk', 'us'])
+        ])
+
+        pipeline = PipelineTestClass.pipeline(batch_size=2) \
+            .match({'amount': {'$gte': 1}}) \
+            .group('$countryCode', totalAmount={'$sum': '$amount'}) \
+            .sort('totalAmount', -1)
+        self.assertEqual(pipeline.stages[1], {'$group': {
+            '_id': '$country_code', 'total_amount': {'$sum': '$amount'}
+        }})
+
+        # Operator arguments keep their names
+        stage = PipelineTestClass.pipeline().project(tagCount={'$reduce': {
+            'input': '$tags', 'initialValue': 0,
+            'in': {'$add': ['$$value', 1]},
+        }}).stages[0]
+        self.assertEqual(stage, {'$project': {'tag_count': {'$reduce': {
+            'input': '$tags', 'initialValue': 0,
+            'in': {'$add': ['$$value', 1]},
+        }}}})
+
+        results = list(pipeline)
+        self.assertIsInstance(results[0], PipelineTestClass)
+        self.assertEqual(
+            [(d._id, d.total_amount) for d in results],
+            [('us', 3), ('uk', 2), ('sg', 1)])
+
+        rv = PipelineTestClass.pipeline(raw=True, allow_disk_use=True) \
+            .unwind('tags').project('countryCode').sort('countryCode')
+        self.assertEqual(
+            [d['country_code'] for d in rv.cursor(prefetch=1)],
+            ['sg', 'uk', 'uk', 'us', 'us'])
+        self.db.drop_collection(PipelineTestClass)
+
+    def test_save_many(self):
+        self.SomeTestClass.__fields__ = {
+            'hello': Field.required(int)
+        }
+
+        docs = [self.SomeTestClass(hello=i) for i in range(5)]
+        docs[2].hello = []
+
+        ids, errors = self.SomeTestClass.save_many(
+            docs, batch_size=2, ordered=False)
+
+        self.assertEquals(list(errors.keys()), [2])
+        self.assertIsInstance(errors[2], TypeError)
+        self.assertIsNone(ids[2])
+        self.assertEquals(self.SomeTestClass.count(), 4)
+        for doc, _id in zip(docs, ids):
+            if _id is not None:
+                self.assertEquals(doc._id, _id)
+
+        docs[0].hello = 42
+        docs[2].hello = 2
+        ids, errors = self.SomeTestClass.save_many(docs[:3])
+        self.assertEquals(errors, {})
+        self.assertEquals(self.SomeTestClass.count(), 5)
+        self.assertEquals(
+            self.SomeTestClass.find_one({'_id': docs[0]._id}).hello, 42)
+
+        # Updates to documents deleted since loading are errors, as in save()
+        loaded = [self.SomeTestClass.find_one(d._id) for d in docs[:2]]
+        self.SomeTestClass.__coll__.remove(docs[1]._id)
+        for d in loaded:
+            d.hello = 7
+        docs[3].hello = 3
+        ids, errors = self.SomeTestClass.save_many(loaded + [docs[3]])
+        self.assertEquals(list(errors.keys()), [1])
+        self.assertIsInstance(errors[1], ValueError)
+        self.assertEquals(ids, [docs[0]._id, None, docs[3]._id])
+        self.assertEquals(loaded[1].changes(), {'$set': {'hello': 7}})
+        self.assertIsNone(self.SomeTestClass.find_one({'_id': docs[1]._id}))
+        self.assertEquals(
+            self.SomeTestClass.find_one({'_id': docs[0]._id}).hello, 7)
+
+    def test_save_many_ordered(self):
+        self.SomeTestClass.__fields__ = {
+            'hello': Field.required(int)
+        }
+
+        docs = [self.SomeTestClass(hello=i) for i in range(3)]
+        del docs[1]['hello']
+
+        ids, errors = self.SomeTestClass.save_many(docs)
+
+        self.assertIsInstance(errors[1], KeyError)
+        self.assertIsNotNone(ids[0])
+        self.assertEquals(ids[1:], [None, None])
+        self.assertEquals(self.SomeTestClass.count(), 1)
+
+    def test_export_import_jsonl(self):
+        for i in range(3):
+            d = self.SomeTestClass()
+            d.hello_world = i
+            d.nested = {'key_a': i}
+            d.save()
+
+        f = StringIO()
+        n = self.SomeTestClass.export_jsonl(f, {'hello_world': {'$gt': 0}})
+        self.assertEquals(n, 2)
+
+        lines = f.getvalue().splitlines()
+        self.assertEquals(len(lines), 2)
+        self.assertIn('"helloWorld": 1', lines[0])
+        self.assertIn('"keyA": 1', lines[0])
+
+        self.db.drop_collection(self.SomeTestClass)
+        f.seek(0)
+        n, errors = self.SomeTestClass.import_jsonl(f, batch_size=1)
+        self.assertEquals(n, 2)
+        self.assertEquals(errors, {})
+
+        d = self.SomeTestClass.find_one({'hello_world': 2})
+        self.assertEquals(d.nested.key_a, 2)
+
+        # Types survive the round trip
+        when = datetime.datetime(2020, 1, 2, 3, 4, 5, 6000)
+        d.created_at = when
+        d.nested.owner_id = d._id
+        d.save()
+        f = StringIO()
+        self.SomeTestClass.export_jsonl(f, {'_id': d._id})
+        self.db.drop_collection(self.SomeTestClass)
+        f.seek(0)
+        self.assertEquals(self.SomeTestClass.import_jsonl(f), (1, {}))
+
+        e = self.SomeTestClass.find_one({'_id': d._id})
+        self.assertEquals(e.created_at.replace(tzinfo=None), when)
+        self.assertEquals(e.nested.owner_id, d._id)
+        self.assertIsInstance(e.nested.owner_id, ObjectId)
+
+    def test_find(self):
+        d = self.SomeTestClass()
+        d.hello = {'world': 1}
+        d.save()
+
+        docs = list(self.SomeTestClass.find().sort('_id').limit(1))
+        self.assertEquals(len(docs), 1)
+        self.assertIsInstance(docs[0], self.SomeTestClass)
+        self.assertEquals(docs[0].hello.world, 1)
+
+    def test_find_raw(self):
+        d = self.SomeTestClass()
+        d.hello = {'world': 1}
+        d.save()
+
+        raw = list(self.SomeTestClass.find({'_id': d._id}, raw=True))
+        self.assertEquals(type(raw[0]), dict)
+        self.assertEquals(type(raw[0]['hello']), dict)
+
+        raw = self.SomeTestClass.find_one({'_id': d._id}, raw=True)
+        self.assertEquals(type(raw), dict)
+
+        e = self.SomeTestClass.from_raw(raw)
+        self.assertIsInstance(e, self.SomeTestClass)
+        self.assertEquals(e.hello.world, 1)
+        self.assertEquals(e._id, d._id)
+
+    def test_query_cache(self):
+        class OtherTestClass(self.db.Document):
+            __cache__ = Cache(max_entries=10, ttl=60)
+
+        d = OtherTestClass()
+        d.name = 'flag'
+        d.value = 1
+        d.save()
+
+        self.assertEquals(OtherTestClass.find_one({'name': 'flag'}).value, 1)
+
+        # Not seen until something invalidates the entry
+        OtherTestClass.__coll__.update(
+            {'_id': d._id}, {'$set': {'value': 2}})
+        e = OtherTestClass.find_one({'name': 'flag'})
+        self.assertEquals(e.value, 1)
+        self.assertIsNot(e, OtherTestClass.find_one({'name': 'flag'}))
+        self.assertEquals(OtherTestClass.__query_cache__.info().hits, 2)
+
+        e.value = 3
+        e.save()
+        self.assertEquals(OtherTestClass.find_one({'name': 'flag'}).value, 3)
+
+        # Anything other than plain equality goes to the server
+        self.assertEquals(
+            OtherTestClass.find_one({'value': {'$gt': 2}}).value, 3)
+        self.assertEquals(len(OtherTestClass.__query_cache__), 1)
+
+        # Documents served from the same entry don't share a snapshot
+        a = OtherTestClass.find_one({'name': 'flag'})
+        b = OtherTestClass.find_one({'name': 'flag'})
+        a.inc('value')
+        b.other = 'b'
+        self.assertEquals(b.changes(), {'$set': {'other': 'b'}})
+        b.save()
+        self.assertEquals(OtherTestClass.find_one(d._id).value, 4)
+
+        e.delete()
+        self.assertIsNone(OtherTestClass.find_one({'name': 'flag'}))
+
+        # True == 1 in Python, but they're different queries to the server
+        OtherTestClass(active=True).save()
+        OtherTestClass.find_one({'active': True})
+        hits = OtherTestClass.__query_cache__.info().hits
+        OtherTestClass.find_one({'active': 1})
+        self.assertEquals(OtherTestClass.__query_cache__.info().hits, hits)
+        self.db.drop_collection(OtherTestClass)
+
     def test_indices(self):
         class OtherTestClass(self.db.Document):
             __indices__ = [
@@ -206,6 +875,26 @@ class DocumentTestCase(unittest.TestCase):
         d = OtherTestClass()
         self.assertEqual(len(d.index_information()), 3)
 
+    def test_read_preference_write_concern(self):
+        class OtherTestClass(self.db.Document):
+            __read_preference__ = pymongo.ReadPreference.SECONDARY_PREFERRED
+            __write_concern__ = {'w': 1}
+
+        class ReportTestClass(OtherTestClass):
+            pass
+
+        for cls in (OtherTestClass, ReportTestClass):
+            self.assertEqual(
+                cls.__coll__.read_preference,
+                pymongo.ReadPreference.SECONDARY_PREFERRED
+            )
+            self.assertEqual(cls.__coll__.write_concern, {'w': 1})
+
+        self.assertNotEqual(
+            self.SomeTestClass.__coll__.read_preference,
+            pymongo.ReadPreference.SECONDARY_PREFERRED
+        )
+
     def test_load_dump_objid(self):
         d = self.SomeTestClass()
         d.hello = 'world'
@@ -216,6 +905,55 @@ class DocumentTestCase(unittest.TestCase):
 
         self.assertEquals(d._id, e._id)
 
+    def test_json_backends(self):
+        d = self.SomeTestClass()
+        d.hello_world = 'world'
+        d.when = datetime.datetime(2014, 5, 1, 12, 30)
+        d.nested = {'a_list': [1, 2]}
+        d.save()
+
+        default = serialise.backend.name
+        try:
+            for name in ('json', 'simplejson', 'orjson'):
+                try:
+                    set_json_backend(name)
+                except ImportError:
+                    continue
+                self.assertEquals(serialise.backend.name, name)
+
+                e = self.SomeTestClass()
+                e.load_json(d.dump_json())
+                self.assertEquals(e._id, d._id)
+                self.assertEquals(e.hello_world, 'world')
+                self.assertEquals(e.when, '2014-05-01T12:30:00')
+                self.assertEquals(e.nested, {'a_list': [1, 2]})
+        finally:
+            set_json_backend(default)
+
+        # Converted up front, rather than by the encoders
+        self.assertEquals(d.dump_dict()['when'], '2014-05-01T12:30:00')
+        e = self.SomeTestClass(when=d.when)
+        self.assertEquals(e.when, d.when)
+
+        self.assertRaises(ValueError, set_json_backend, 'marshal')
+
+    def test_dump_json_many(self):
+        docs = [self.SomeTestClass(hello_world=i) for i in range(5)]
+        for d in docs:
+            d.save()
+        expected = '[' + ', '.join(d.dump_json() for d in docs) + ']'
+
+        self.assertEquals(self.SomeTestClass.dump_json_many(docs), expected)
+        self.assertEquals(
+            ''.join(self.SomeTestClass.iter_json_many(docs, chunk_size=2)),
+            expected)
+        self.assertEquals(''.join(self.SomeTestClass.iter_json_many([])), '[]')
+
+        cursor = self.SomeTestClass.find().sort('hello_world')
+        self.assertEquals(cursor.to_json(), expected)
+        cursor = self.SomeTestClass.find().sort('hello_world')
+        self.assertEquals(len(list(cursor.iter_json(chunk_size=3))), 3)
+
     def test_field_pollution(self):
         d = self.SomeTestClass()
         d.hello = 'world'
@@ -319,6 +1057,41 @@ class DocumentTestCase(unittest.TestCase):
         d.c = [{'d': 2}]
         self.assertEquals(type(d.c[0]), DotDict)
 
+    def test_lazy_dotify(self):
+        d = LazyDotDict({'a': {'b': 2}, 'c': [{'d': 2}]})
+        self.assertEquals(type(dict.__getitem__(d, 'a')), dict)
+
+        a = d.a
+        self.assertIsInstance(a, DotDict)
+        self.assertIs(d.a, a)
+        self.assertEquals(d.a.b, 2)
+        self.assertEquals(d.c[0].d, 2)
+
+    def test_lazy_document(self):
+        class OtherTestClass(self.db.Document):
+            __lazy__ = True
+
+        d = OtherTestClass({'helloWorld': {'nestedKey': 1}})
+        self.assertIsInstance(d, LazyDotDict)
+        self.assertEquals(d.hello_world.nested_key, 1)
+        self.assertIn('helloWorld', d.dump_dict())
+
+        d.save()
+        e = OtherTestClass.find_one({'_id': d._id})
+        self.assertEquals(e.hello_world.nested_key, 1)
+
+        # Changes made without going through LazyDotDict are still tracked
+        d = OtherTestClass(nested={'a': {'x': 1}})
+        d.save()
+        e = OtherTestClass.find_one({'_id': d._id})
+        for v in dict.values(e.nested):
+            v['x'] = 2
+        self.assertEquals(e.changes(), {'$set': {'nested.a.x': 2}})
+        e.save()
+        self.assertEquals(
+            OtherTestClass.find_one({'_id': d._id}, raw=True)['nested'],
+            {'a': {'x': 2}})
+
     def test_geo_point(self):
         self.SomeTestClass.__fields__ = {
             'hello': Field.geo_point()
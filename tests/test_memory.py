@@ -0,0 +1,283 @@
+import re
+import unittest
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from mongorm import Database, Index
+
+
+class MemoryTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.db = Database(backend='memory', db='orm_test_memory')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.drop()
+
+    def setUp(self):
+        self.coll = self.db.__db__['memory_test']
+
+    def tearDown(self):
+        self.db.drop_collection('memory_test')
+
+    def insert(self, *docs):
+        for i, doc in enumerate(docs):
+            doc.setdefault('_id', i)
+            self.coll.insert(doc)
+
+    def ids(self, spec, **kwargs):
+        return [d['_id'] for d in self.coll.find(spec, **kwargs)]
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            Database(backend='nope')
+
+    def test_shared_by_host(self):
+        self.insert({'a': 1})
+        other = Database(backend='memory', db='orm_test_memory')
+        self.assertEqual(other.__db__['memory_test'].count(), 1)
+        self.assertEqual(other.host, 'localhost')
+        self.assertEqual(other.port, 27017)
+
+    def test_documents_are_copied(self):
+        doc = {'a': {'b': 1}}
+        self.coll.insert(doc)
+        doc['a']['b'] = 2
+        found = self.coll.find_one()
+        self.assertEqual(found['a']['b'], 1)
+        found['a']['b'] = 3
+        self.assertEqual(self.coll.find_one()['a']['b'], 1)
+
+    def test_query_operators(self):
+        self.insert(
+            {'n': 1, 'tags': ['a', 'b'], 'sub': {'x': 'hello'}},
+            {'n': 2, 'tags': ['b'], 'sub': {'x': 'world'}},
+            {'n': 3, 'flag': True},
+            {'n': 4.0, 'items': [{'k': 1, 'v': 'x'}, {'k': 2, 'v': 'y'}]}
+        )
+        self.assertEqual(self.ids({'n': {'$gt': 1, '$lte': 3}}), [1, 2])
+        self.assertEqual(self.ids({'n': 4}), [3])
+        self.assertEqual(self.ids({'n': {'$in': [1, 3]}}), [0, 2])
+        self.assertEqual(self.ids({'n': {'$nin': [1, 3]}}), [1, 3])
+        self.assertEqual(self.ids({'n': {'$ne': 2}}), [0, 2, 3])
+        self.assertEqual(self.ids({'n': {'$mod': [2, 0]}}), [1, 3])
+        self.assertEqual(self.ids({'tags': 'b'}), [0, 1])
+        self.assertEqual(self.ids({'tags': ['b']}), [1])
+        self.assertEqual(self.ids({'tags': {'$all': ['a', 'b']}}), [0])
+        self.assertEqual(self.ids({'tags': {'$size': 1}}), [1])
+        self.assertEqual(self.ids({'flag': {'$exists': True}}), [2])
+        self.assertEqual(self.ids({'flag': None}), [0, 1, 3])
+        self.assertEqual(self.ids({'flag': 1}), [])
+        self.assertEqual(self.ids({'sub.x': {'$regex': '^h'}}), [0])
+        self.assertEqual(self.ids({'sub.x': re.compile('D$', re.I)}), [1])
+        self.assertEqual(self.ids({'sub.x': {'$not': re.compile('^h')}}),
+                         [1, 2, 3])
+        self.assertEqual(self.ids({'items.k': 2}), [3])
+        self.assertEqual(self.ids({'items.0.v': 'x'}), [3])
+        self.assertEqual(
+            self.ids({'items': {'$elemMatch': {'k': 1, 'v': 'y'}}}), [])
+        self.assertEqual(
+            self.ids({'items': {'$elemMatch': {'k': 2, 'v': 'y'}}}), [3])
+        self.assertEqual(self.ids({'$or': [{'n': 1}, {'flag': True}]}),
+                         [0, 2])
+        self.assertEqual(self.ids({'$nor': [{'n': 1}, {'flag': True}]}),
+                         [1, 3])
+        self.assertEqual(self.ids({'$and': [{'n': {'$gt': 1}},
+                                            {'n': {'$lt': 3}}]}), [1])
+
+    def test_update_operators(self):
+        self.insert({'n': 1, 'tags': ['a'], 'sub': {'x': 1}})
+        self.coll.update({'_id': 0}, {
+            '$inc': {'n': 2, 'sub.x': 1},
+            '$push': {'tags': {'$each': ['b', 'c', 'd'], '$slice': -3}},
+            '$set': {'sub.y.z': 'deep'},
+            '$unset': {'missing': 1}
+        })
+        self.assertEqual(self.coll.find_one(0), {
+            '_id': 0, 'n': 3, 'tags': ['b', 'c', 'd'],
+            'sub': {'x': 2, 'y': {'z': 'deep'}}
+        })
+
+        self.coll.update({'_id': 0}, {
+            '$addToSet': {'tags': {'$each': ['b', 'e']}},
+            '$pull': {'tags': 'c'},
+            '$rename': {'sub': 'renamed'},
+            '$mul': {'n': 2},
+            '$max': {'top': 5}
+        })
+        self.assertEqual(self.coll.find_one(0), {
+            '_id': 0, 'n': 6, 'tags': ['b', 'd', 'e'], 'top': 5,
+            'renamed': {'x': 2, 'y': {'z': 'deep'}}
+        })
+
+        self.coll.update({'_id': 0}, {'$pop': {'tags': -1}})
+        self.coll.update({'_id': 0}, {'replaced': True})
+        self.assertEqual(self.coll.find_one(0), {'_id': 0, 'replaced': True})
+
+    def test_update_multi_and_upsert(self):
+        self.insert({'n': 1}, {'n': 1}, {'n': 2})
+        rv = self.coll.update({'n': 1}, {'$set': {'m': 1}})
+        self.assertEqual(rv['n'], 1)
+        rv = self.coll.update({'n': 1}, {'$set': {'m': 1}}, multi=True)
+        self.assertEqual(rv['n'], 2)
+        self.assertEqual(rv['nModified'], 1)
+
+        rv = self.coll.update({'n': 5, 'k': {'$gt': 1}},
+                              {'$setOnInsert': {'new': True}}, upsert=True)
+        doc = self.coll.find_one(rv['upserted'])
+        self.assertEqual(doc['n'], 5)
+        self.assertTrue(doc['new'])
+        self.assertNotIn('k', doc)
+
+    def test_remove(self):
+        self.insert({'n': 1}, {'n': 1}, {'n': 2})
+        self.assertEqual(self.coll.remove({'n': 1}, multi=False)['n'], 1)
+        self.assertEqual(self.coll.remove({'n': 1})['n'], 1)
+        self.assertEqual(self.coll.count(), 1)
+        self.coll.remove(2)
+        self.assertEqual(self.coll.count(), 0)
+
+    def test_cursor(self):
+        self.insert(*[{'n': i % 3, 'm': i} for i in range(6)])
+        cursor = self.coll.find().sort([('n', 1), ('m', -1)])
+        self.assertEqual([d['m'] for d in cursor], [3, 0, 4, 1, 5, 2])
+        cursor = self.coll.find(sort=[('m', -1)]).skip(1).limit(2)
+        self.assertEqual([d['m'] for d in cursor], [4, 3])
+        self.assertEqual(cursor.count(), 6)
+        self.assertEqual(cursor.count(with_limit_and_skip=True), 2)
+        self.assertEqual(self.coll.find().sort('m')[2]['m'], 2)
+        self.assertEqual(
+            [d['m'] for d in self.coll.find().sort('m')[1:3]], [1, 2])
+        self.assertEqual(sorted(self.coll.find().distinct('n')), [0, 1, 2])
+        self.assertEqual(self.coll.distinct('m', {'n': 0}), [0, 3])
+
+    def test_projection(self):
+        self.insert({'a': 1, 'b': {'c': 2, 'd': 3}})
+        self.assertEqual(self.coll.find_one({}, fields=['b.c']),
+                         {'_id': 0, 'b': {'c': 2}})
+        self.assertEqual(self.coll.find_one({}, fields={'a': 1, '_id': 0}),
+                         {'a': 1})
+        self.assertEqual(self.coll.find_one({}, fields={'b': 0}),
+                         {'_id': 0, 'a': 1})
+
+    def test_indexes(self):
+        self.insert({'a': 1, 'tags': ['x', 'y']}, {'a': 2, 'tags': ['y']})
+        self.coll.ensure_index('tags')
+        self.coll.ensure_index([('a', 1)], unique=True)
+        self.assertEqual(sorted(self.coll.index_information()),
+                         ['_id_', 'a_1', 'tags_1'])
+        self.assertTrue(self.coll.index_information()['a_1']['unique'])
+
+        self.assertEqual(self.ids({'tags': 'y'}), [0, 1])
+        self.assertEqual(self.ids({'tags': {'$in': ['x', 'z']}}), [0])
+
+        with self.assertRaises(DuplicateKeyError):
+            self.coll.insert({'a': 1})
+        with self.assertRaises(DuplicateKeyError):
+            self.coll.update({'_id': 1}, {'$set': {'a': 1}})
+        with self.assertRaises(DuplicateKeyError):
+            self.coll.insert({'_id': 0})
+        self.assertEqual(self.coll.find_one(1)['a'], 2)
+
+        self.coll.update({'_id': 1}, {'$set': {'tags': ['z']}})
+        self.assertEqual(self.ids({'tags': 'y'}), [0])
+        self.assertEqual(self.ids({'tags': 'z'}), [1])
+
+        self.coll.drop_index('a_1')
+        self.coll.insert({'a': 1})
+        self.assertEqual(self.coll.find({'a': 1}).count(), 2)
+
+        # Index hits come back in insertion order
+        self.coll.remove(0)
+        self.coll.insert({'_id': 0, 'tags': ['z']})
+        self.assertEqual(self.ids({'tags': 'z'}), [1, 0])
+
+    def test_sync_indexes(self):
+        class MemoryIndexTestClass(self.db.Document):
+            __indices__ = [Index('name', unique=True)]
+
+        self.db.sync_indexes()
+        info = MemoryIndexTestClass.__coll__.index_information()
+        self.assertTrue(info['name_1']['unique'])
+        self.db.drop_collection(MemoryIndexTestClass)
+
+    def test_find_and_modify(self):
+        self.insert({'n': 1}, {'n': 2})
+        doc = self.coll.find_and_modify({'n': {'$gt': 0}}, {'$inc': {'n': 1}},
+                                        sort=[('n', -1)], new=True)
+        self.assertEqual(doc, {'_id': 1, 'n': 3})
+        doc = self.coll.find_and_modify({'_id': 0}, {'$inc': {'n': 1}})
+        self.assertEqual(doc, {'_id': 0, 'n': 1})
+        doc = self.coll.find_and_modify({'_id': 0}, remove=True)
+        self.assertEqual(doc['n'], 2)
+        self.assertIsNone(self.coll.find_one(0))
+        doc = self.coll.find_and_modify({'_id': 9}, {'$set': {'n': 9}},
+                                        upsert=True, new=True)
+        self.assertEqual(doc, {'_id': 9, 'n': 9})
+
+    def test_bulk(self):
+        self.coll.ensure_index('a', unique=True)
+        bulk = self.coll.initialize_ordered_bulk_op()
+        bulk.insert({'a': 1})
+        bulk.find({'a': 1}).update_one({'$set': {'b': 1}})
+        bulk.find({'a': 2}).upsert().update_one({'$set': {'b': 2}})
+        result = bulk.execute()
+        self.assertEqual(result['nInserted'], 1)
+        self.assertEqual(result['nModified'], 1)
+        self.assertEqual(result['nUpserted'], 1)
+
+        bulk = self.coll.initialize_unordered_bulk_op()
+        bulk.insert({'a': 1})
+        bulk.insert({'a': 3})
+        with self.assertRaises(BulkWriteError) as cm:
+            bulk.execute()
+        self.assertEqual(cm.exception.details['writeErrors'][0]['index'], 0)
+        self.assertEqual(cm.exception.details['nInserted'], 1)
+        self.assertEqual(self.coll.count(), 3)
+
+    def test_aggregate(self):
+        self.insert(
+            {'k': 'a', 'v': 1, 'tags': ['x', 'y']},
+            {'k': 'a', 'v': 3, 'tags': ['y']},
+            {'k': 'b', 'v': 5, 'tags': []}
+        )
+        rv = self.coll.aggregate([
+            {'$match': {'v': {'$lt': 5}}},
+            {'$group': {'_id': '$k', 'total': {'$sum': '$v'},
+                        'avg': {'$avg': '$v'}, 'n': {'$sum': 1}}}
+        ])
+        self.assertEqual(rv['result'],
+                         [{'_id': 'a', 'total': 4, 'avg': 2.0, 'n': 2}])
+
+        cursor = self.coll.aggregate([
+            {'$unwind': '$tags'},
+            {'$group': {'_id': '$tags', 'ids': {'$push': '$_id'}}},
+            {'$sort': {'_id': -1}},
+            {'$project': {'ids': 1}}
+        ], cursor={})
+        self.assertEqual(list(cursor), [
+            {'_id': 'y', 'ids': [0, 1]}, {'_id': 'x', 'ids': [0]}
+        ])
+
+    def test_document(self):
+        class MemoryTestClass(self.db.Document):
+            __indices__ = [Index('name')]
+
+        d = MemoryTestClass(name='x', count_of=1)
+        d.save()
+        d.count_of = 2
+        d.save()
+
+        e = MemoryTestClass.find_one({'name': 'x'})
+        self.assertEqual(e._id, d._id)
+        self.assertEqual(e.count_of, 2)
+        self.assertEqual(MemoryTestClass.find().count(), 1)
+        self.assertIn('name_1', MemoryTestClass.__coll__.index_information())
+        self.assertIn(MemoryTestClass.__collection__,
+                      self.db.get_collections())
+
+        e.delete()
+        self.assertIsNone(MemoryTestClass.find_one(d._id))
+        self.db.drop_collection(MemoryTestClass)